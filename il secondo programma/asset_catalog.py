@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import namedtuple
+from PIL import Image, ImageStat
+from sprite_store import RAW_SPRITE_EXTENSION, write_raw_sprite
+
+VALID_EXTENSIONS = (".png", ".jpg", ".jpeg")
+EXIF_ORIENTATION_TAG = 0x0112
+# Orientamenti EXIF gestiti (1 o assente = nessuna rotazione); le specchiature non vengono applicate
+ORIENTATION_TRANSPOSE = {3: Image.Transpose.ROTATE_180, 6: Image.Transpose.ROTATE_270, 8: Image.Transpose.ROTATE_90}
+
+_ASSET_COLUMNS = ("path, name, mtime, width, height, bbox_left, bbox_top, bbox_right, bbox_bottom,"
+                  " avg_r, avg_g, avg_b, file_size, derivative_path, derivative_width, derivative_height, raw_path")
+
+
+# (path, name) come primi campi: resta compatibile con le vecchie tuple di load_images_from_folder
+class AssetRecord(namedtuple("AssetRecord", ["path", "name", "mtime", "width", "height", "bbox", "avg_color",
+                                             "derivative", "derivative_size", "raw"], defaults=(None, None, None))):
+    __slots__ = ()
+
+    @property
+    def render_path(self):
+        # File da decodificare per il rendering: la derivata normalizzata se esiste
+        return self.derivative or self.path
+
+    @property
+    def render_size(self):
+        return self.derivative_size or (self.width, self.height)
+
+
+def apply_orientation(img, orientation):
+    # Unico punto in cui si applica l'orientamento EXIF: catalogo, sprite e sfondi ruotano allo stesso modo.
+    # L'orientamento va letto dal file aperto (prima di convert() o draft())
+    if orientation in ORIENTATION_TRANSPOSE:
+        return img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return img
+
+
+def open_oriented(path):
+    # Apre un file come RGBA gia' orientato
+    with Image.open(path) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+        rgba = img.convert("RGBA")
+    return apply_orientation(rgba, orientation)
+
+
+class AssetCatalog:
+    """Indice su disco (SQLite) degli asset: dimensioni, bbox alpha e colore medio per file."""
+
+    AVG_COLOR_SAMPLE_SIZE = 64  # Lato massimo della miniatura usata per il colore medio
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS assets ("
+            " path TEXT PRIMARY KEY, folder TEXT NOT NULL, name TEXT NOT NULL,"
+            " mtime REAL NOT NULL, file_size INTEGER NOT NULL,"
+            " width INTEGER NOT NULL, height INTEGER NOT NULL,"
+            " bbox_left INTEGER, bbox_top INTEGER, bbox_right INTEGER, bbox_bottom INTEGER,"
+            " avg_r INTEGER, avg_g INTEGER, avg_b INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS assets_folder ON assets (folder)")
+        # Colonne aggiunte dopo la prima versione del catalogo
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(assets)")}
+        for column, column_type in (("derivative_path", "TEXT"), ("derivative_width", "INTEGER"), ("derivative_height", "INTEGER"),
+                                     ("raw_path", "TEXT")):
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE assets ADD COLUMN {column} {column_type}")
+        self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def scan(self, folder_path):
+        """Restituisce gli AssetRecord della cartella, rileggendo solo i file con mtime/size cambiati."""
+        if not folder_path or not os.path.isdir(folder_path):
+            return []
+        folder_path = os.path.normpath(folder_path)
+
+        with self._lock:
+            known = {row[0]: row for row in self.conn.execute(
+                f"SELECT {_ASSET_COLUMNS} FROM assets WHERE folder = ?", (folder_path,))}
+
+        records = []
+        seen = set()
+        updates = []
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(VALID_EXTENSIONS) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                seen.add(entry.path)
+                row = known.get(entry.path)
+                if row is not None and row[2] == stat.st_mtime and row[12] == stat.st_size:
+                    records.append(self._record_from_row(row))
+                    continue
+                record = self._read_asset(entry.path, stat.st_mtime)
+                if record is None:
+                    continue
+                records.append(record)
+                updates.append((record, folder_path, stat.st_size))
+
+        removed = [path for path in known if path not in seen]
+        if updates or removed:
+            with self._lock:
+                for record, folder, file_size in updates:
+                    self._store(record, folder, file_size)
+                self.conn.executemany("DELETE FROM assets WHERE path = ?", [(p,) for p in removed])
+                self.conn.commit()
+
+        records.sort(key=lambda r: r.path)
+        return records
+
+    def get(self, path):
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {_ASSET_COLUMNS} FROM assets WHERE path = ?", (os.path.normpath(path),)).fetchone()
+        return self._record_from_row(row) if row else None
+
+    def ingest(self, record, output_dir, max_size, write_raw=False):
+        """Ritaglia l'asset al bbox alpha e salva una derivata PNG ridotta a max_size (w, h).
+
+        La derivata e' gia' orientata e viene registrata nel catalogo: i render successivi
+        decodificano solo il capo, senza i margini trasparenti del file originale.
+        Con write_raw scrive anche una copia RGBA grezza, apribile via mmap senza decodifica.
+        """
+        has_derivative = record.derivative and os.path.exists(record.derivative)
+        if has_derivative and (not write_raw or (record.raw and os.path.exists(record.raw))):
+            return record
+        key = f"{record.path}|{record.mtime}|{max_size[0]}x{max_size[1]}"
+        output_dir = os.path.abspath(output_dir)
+        derivative_path = os.path.join(output_dir, hashlib.sha1(key.encode("utf-8")).hexdigest()[:24] + ".png")
+        img = None
+
+        if not os.path.exists(derivative_path):
+            try:
+                img = open_oriented(record.path)
+                bbox = img.getchannel("A").getbbox()
+                if bbox and bbox != (0, 0, img.width, img.height):
+                    img = img.crop(bbox)
+                img.thumbnail(max_size, Image.Resampling.LANCZOS)
+                os.makedirs(output_dir, exist_ok=True)
+                # Scrittura atomica: un render concorrente non deve leggere un PNG a meta'. Il file
+                # temporaneo e' unico per scrittore: warm-up e generazione possono fare l'ingest dello stesso asset
+                fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=output_dir)
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        img.save(f, format="PNG")
+                    os.replace(tmp_path, derivative_path)
+                except Exception:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                derivative_size = img.size
+            except Exception as e:
+                print(f"DEBUG: Ingest fallito per {record.path}: {e}")
+                return record
+        else:
+            with Image.open(derivative_path) as derivative:
+                derivative_size = derivative.size
+
+        raw_path = None
+        if write_raw:
+            raw_path = os.path.splitext(derivative_path)[0] + RAW_SPRITE_EXTENSION
+            if not os.path.exists(raw_path):
+                try:
+                    if img is None:
+                        with Image.open(derivative_path) as derivative:
+                            img = derivative.convert("RGBA")
+                    write_raw_sprite(img, raw_path)
+                except Exception as e:
+                    print(f"DEBUG: Sprite grezzo non scritto per {record.path}: {e}")
+                    raw_path = None
+
+        with self._lock:
+            self.conn.execute(
+                "UPDATE assets SET derivative_path = ?, derivative_width = ?, derivative_height = ?,"
+                " raw_path = COALESCE(?, raw_path) WHERE path = ? AND mtime = ?",
+                (derivative_path, derivative_size[0], derivative_size[1], raw_path, record.path, record.mtime))
+            self.conn.commit()
+        return record._replace(derivative=derivative_path, derivative_size=derivative_size, raw=raw_path or record.raw)
+
+    def _store(self, record, folder, file_size):
+        bbox = record.bbox or (None, None, None, None)
+        avg = record.avg_color or (None, None, None)
+        # Un file modificato perde la derivata: verra' ricreata al prossimo ingest
+        self.conn.execute(
+            "INSERT OR REPLACE INTO assets (path, folder, name, mtime, file_size, width, height,"
+            " bbox_left, bbox_top, bbox_right, bbox_bottom, avg_r, avg_g, avg_b)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.path, folder, record.name, record.mtime, file_size, record.width, record.height) + tuple(bbox) + tuple(avg))
+
+    def _record_from_row(self, row):
+        bbox = tuple(row[5:9]) if row[5] is not None else None
+        avg_color = tuple(row[9:12]) if row[9] is not None else None
+        derivative_size = (row[14], row[15]) if row[13] else None
+        return AssetRecord(row[0], row[1], row[2], row[3], row[4], bbox, avg_color, row[13], derivative_size, row[16])
+
+    def _read_asset(self, path, mtime):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with Image.open(path) as img:
+                width, height = img.size
+                orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+                img.draft("RGB", (self.AVG_COLOR_SAMPLE_SIZE, self.AVG_COLOR_SAMPLE_SIZE))
+                img = img.convert("RGBA")
+                # Stesse rotazioni del render, cosi' dimensioni e bbox sono quelle renderizzate
+                img = apply_orientation(img, orientation)
+                if orientation in (6, 8):
+                    width, height = height, width
+                alpha = img.getchannel("A")
+                # Bbox in coordinate del file originale (la draft JPEG puo' aver ridotto l'immagine)
+                bbox = alpha.getbbox()
+                if bbox and img.size != (width, height):
+                    sx, sy = width / img.width, height / img.height
+                    bbox = (int(bbox[0] * sx), int(bbox[1] * sy),
+                            min(width, int(round(bbox[2] * sx))), min(height, int(round(bbox[3] * sy))))
+                sample = img.copy()
+                sample.thumbnail((self.AVG_COLOR_SAMPLE_SIZE, self.AVG_COLOR_SAMPLE_SIZE))
+                avg_color = self._average_color(sample)
+        except Exception as e:
+            print(f"DEBUG: Impossibile leggere {path}: {e}")
+            return None
+        return AssetRecord(path, name, mtime, width, height, bbox, avg_color)
+
+    def _average_color(self, img):
+        # Stessa soglia alpha di OutfitGeneratorLogic.get_average_color
+        mask = img.getchannel("A").point(lambda a: 255 if a > 50 else 0)
+        if not mask.getbbox():
+            return (128, 128, 128)
+        stat = ImageStat.Stat(img.convert("RGB"), mask)
+        return tuple(map(int, stat.mean[:3]))
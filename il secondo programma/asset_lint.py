@@ -0,0 +1,198 @@
+import os
+import sys
+import shutil
+import hashlib
+import argparse
+from collections import defaultdict
+from PIL import Image, ImageOps
+from asset_catalog import EXIF_ORIENTATION_TAG, ORIENTATION_TRANSPOSE
+from outfit_generator_logic import OutfitGeneratorLogic
+
+# Orientamenti EXIF gestiti da apply_orientation (1 = nessuna rotazione)
+HANDLED_ORIENTATIONS = (None, 1) + tuple(ORIENTATION_TRANSPOSE)
+UNSUPPORTED_MODES = ("CMYK", "P")
+BACKUP_FOLDER = "originali"
+# Problemi che --fix non corregge: un prodotto senza alpha va scontornato a mano, e un asset piu'
+# grande del formato di produzione serve ancora ai master 4K/8K
+UNFIXABLE_ISSUES = ("illeggibile", "senza alpha", "sovradimensionato")
+# Formato piu' grande da servire: i master 4K/8K (master_crop) ricampionano gli originali, non le derivate.
+# --fix non riduce mai un originale sotto quello che serve a questo formato
+LARGEST_FRAME = (4320, 7680)
+
+
+def render_limit(logic, category, frame):
+    # Dimensione massima a cui l'asset viene renderizzato nel formato `frame`
+    if category == "sfondi":
+        return frame.width, frame.height
+    width, height = logic.max_sprite_size(category)
+    return int(width * frame.scale), int(height * frame.scale)
+
+
+def parse_frame(value):
+    # "WxH" -> (w, h) per --frame
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"formato non valido: '{value}' (atteso LARGHEZZAxALTEZZA, es. 1080x1920)")
+    return width, height
+
+
+def oriented_size(img, orientation):
+    width, height = img.size
+    return (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+
+
+def needed_scale(category, size, limit):
+    # Scala a cui l'asset viene usato: gli sfondi coprono il frame, i prodotti ci stanno dentro
+    if category == "sfondi":
+        return max(limit[0] / size[0], limit[1] / size[1])
+    return min(limit[0] / size[0], limit[1] / size[1])
+
+
+def lint_asset(logic, category, path, oversize_factor, frame):
+    issues = []
+    try:
+        with Image.open(path) as img:
+            orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+            size = oriented_size(img, orientation)
+            mode = img.mode
+            has_alpha = "A" in img.getbands() or "transparency" in img.info
+    except Exception as e:
+        return [("illeggibile", str(e))]
+
+    # Due soglie: oltre il formato piu' grande l'asset si puo' ridurre (--fix), oltre il solo formato
+    # di produzione viene segnalato ma conservato per i master
+    fix_scale = needed_scale(category, size, render_limit(logic, category, logic.frame(*LARGEST_FRAME)))
+    scale = needed_scale(category, size, render_limit(logic, category, frame))
+    if fix_scale < 1:
+        issues.append(("troppo grande", f"{size[0]}x{size[1]}, anche i master {LARGEST_FRAME[0]}x{LARGEST_FRAME[1]} "
+                                        f"ne usano al massimo {int(size[0] * fix_scale)}x{int(size[1] * fix_scale)}"))
+    elif scale * oversize_factor < 1:
+        issues.append(("sovradimensionato", f"{size[0]}x{size[1]}, il formato {frame.width}x{frame.height} "
+                                            f"ne usa al massimo {int(size[0] * scale)}x{int(size[1] * scale)}"))
+    if category != "sfondi" and not has_alpha:
+        issues.append(("senza alpha", f"modo {mode}: lo sfondo del prodotto non e' trasparente"))
+    if mode in UNSUPPORTED_MODES:
+        issues.append(("modo colore", f"modo {mode}"))
+    if orientation not in HANDLED_ORIENTATIONS:
+        issues.append(("orientamento EXIF", f"valore {orientation} non gestito da apply_orientation"))
+    return issues
+
+
+def find_duplicates(paths):
+    # Prima per dimensione del file, poi per hash: solo i candidati vengono letti per intero
+    by_size = defaultdict(list)
+    for path in paths:
+        by_size[os.path.getsize(path)].append(path)
+    groups = []
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        by_hash = defaultdict(list)
+        for path in candidates:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            by_hash[digest.hexdigest()].append(path)
+        groups.extend(sorted(group) for group in by_hash.values() if len(group) > 1)
+    return groups
+
+
+def normalize_asset(logic, category, path):
+    """Riscrive l'asset orientato, in un modo colore supportato e alla dimensione massima utile.
+
+    L'originale viene spostato nella sottocartella BACKUP_FOLDER, ignorata dal catalogo. I prodotti
+    vengono sempre salvati in PNG: un prodotto JPEG diventa un .png accanto all'originale, che viene
+    rimosso. Restituisce (percorso scritto, dimensione).
+    """
+    with Image.open(path) as img:
+        img.load()
+        fmt = img.format
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        normalized = ImageOps.exif_transpose(img)
+    if "exif" in normalized.info:
+        del normalized.info["exif"]
+
+    if category == "sfondi" or not has_alpha:
+        # Un canale alpha tutto opaco non renderebbe trasparente lo sfondo del prodotto
+        normalized = normalized.convert("RGB")
+    else:
+        normalized = normalized.convert("RGBA")
+
+    # Mai sotto la dimensione che serve al formato piu' grande
+    scale = needed_scale(category, normalized.size, render_limit(logic, category, logic.frame(*LARGEST_FRAME)))
+    if scale < 1:
+        new_size = (max(1, round(normalized.width * scale)), max(1, round(normalized.height * scale)))
+        normalized = normalized.resize(new_size, Image.Resampling.LANCZOS)
+
+    backup_dir = os.path.join(os.path.dirname(path), BACKUP_FOLDER)
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_path = os.path.join(backup_dir, os.path.basename(path))
+    shutil.copy2(path, backup_path)
+
+    output_path = path
+    if category != "sfondi" and fmt != "PNG":
+        folder = os.path.dirname(path)
+        output_path = os.path.join(folder, logic.get_unique_filename(folder, os.path.splitext(os.path.basename(path))[0] + ".png"))
+    tmp_path = output_path + ".tmp"
+    if category != "sfondi" or fmt == "PNG":
+        normalized.save(tmp_path, format="PNG", optimize=True)
+    else:
+        normalized.save(tmp_path, format="JPEG", quality=92)
+    os.replace(tmp_path, output_path)
+    if output_path != path:
+        os.remove(path) # Copia gia' in BACKUP_FOLDER
+    return output_path, normalized.size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Controlla (e normalizza) gli asset del generatore di outfit.")
+    parser.add_argument("--base", help="Cartella 'foto per generatore' (default: quella del programma)")
+    parser.add_argument("--categories", nargs="*", help="Categorie da controllare (default: tutte)")
+    parser.add_argument("--oversize-factor", type=float, default=1.5,
+                        help="Segnala gli asset piu' grandi di questo fattore rispetto alla dimensione di render (default 1.5)")
+    parser.add_argument("--frame", type=parse_frame,
+                        help="Formato di produzione LARGHEZZAxALTEZZA per la segnalazione (default: formato di riferimento)")
+    parser.add_argument("--fix", action="store_true",
+                        help="Scrive versioni normalizzate al posto dei file con problemi (originali in 'originali/')")
+    args = parser.parse_args(argv)
+
+    logic = OutfitGeneratorLogic()
+    if args.base:
+        logic.base_path = args.base
+        logic.category_paths = {item: os.path.join(args.base, item.lower()) for item in logic.accessory_types}
+    categories = args.categories or logic.accessory_types
+    frame = logic.frame(*args.frame) if args.frame else logic.frame()
+
+    total_issues = 0
+    all_paths = []
+    for category in categories:
+        records = logic.load_images_from_folder(logic.get_category_path(category))
+        for record in records:
+            all_paths.append(record.path)
+            issues = lint_asset(logic, category, record.path, args.oversize_factor, frame)
+            if not issues:
+                continue
+            total_issues += len(issues)
+            for code, message in issues:
+                print(f"[{category}] {record.path}: {code} - {message}")
+            fixable = [code for code, _ in issues if code not in UNFIXABLE_ISSUES]
+            if args.fix and fixable:
+                try:
+                    new_path, new_size = normalize_asset(logic, category, record.path)
+                    all_paths[-1] = new_path # I duplicati si cercano tra i file rimasti
+                    print(f"[{category}] {record.path}: normalizzato a {new_size[0]}x{new_size[1]} in {new_path}")
+                except Exception as e:
+                    print(f"[{category}] {record.path}: normalizzazione fallita - {e}")
+
+    for group in find_duplicates(all_paths):
+        total_issues += 1
+        print(f"[duplicati] {' = '.join(group)}")
+
+    print(f"{len(all_paths)} asset controllati, {total_issues} problemi trovati.")
+    return 1 if total_issues else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
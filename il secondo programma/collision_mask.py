@@ -0,0 +1,151 @@
+import sys
+import math
+from PIL import Image
+
+ALPHA_THRESHOLD = 32  # Pixel con alpha sotto questa soglia (ombre sfumate, aloni) non occupano spazio
+
+
+def alpha_mask_rows(alpha, columns, rows, threshold=ALPHA_THRESHOLD):
+    """Maschera di occupazione columns x rows da un canale alpha ("L"): una int per riga, bit c = colonna c.
+
+    Una cella e' occupata se contiene almeno un pixel sopra soglia (stima per eccesso).
+    """
+    binary = alpha.point(lambda a: 255 if a >= threshold else 0)
+    # BOX fa la media dei pixel della cella: qualunque pixel pieno la rende > 0
+    cells = binary.resize((columns, rows), Image.Resampling.BOX)
+    data = cells.tobytes()
+    mask = []
+    for row in range(rows):
+        bits = 0
+        for column, value in enumerate(data[row * columns:(row + 1) * columns]):
+            if value:
+                bits |= 1 << column
+        mask.append(bits)
+    return mask
+
+
+def mask_nbytes(mask):
+    # Memoria di una maschera (lista di int), per il budget della cache delle maschere
+    return sys.getsizeof(mask) + sum(sys.getsizeof(bits) for bits in mask)
+
+
+def row_runs(bits):
+    # Tratti consecutivi di bit a 1: [(prima colonna, lunghezza), ...]
+    runs = []
+    column = 0
+    while bits:
+        if bits & 1:
+            length = (~bits & (bits + 1)).bit_length() - 1 # Numero di 1 consecutivi dal bit basso
+            runs.append((column, length))
+            bits >>= length
+            column += length
+        else:
+            skip = (bits & -bits).bit_length() - 1 # Zeri prima del prossimo 1
+            bits >>= skip
+            column += skip
+    return runs
+
+
+def spread_right(bits, length):
+    # Bit x impostato se `bits` ha almeno un 1 in [x, x + length): OR di bits >> j per j < length
+    result, span = bits, 1
+    while span * 2 <= length:
+        result |= result >> span
+        span *= 2
+    if span < length:
+        result |= result >> (length - span)
+    return result
+
+
+class CoverageMask:
+    """Occupazione del frame a celle di `cell` pixel, una int Python per riga (bitset delle colonne).
+
+    Gli oggetti vengono registrati con la maschera del loro canale alpha: un test di collisione
+    confronta righe intere con un AND tra interi, invece dei box che includono gli angoli vuoti.
+    """
+
+    def __init__(self, width, height, cell):
+        self.cell = max(1, int(cell))
+        self.columns = math.ceil(width / self.cell)
+        self.rows = [0] * math.ceil(height / self.cell)
+        self._full_row = (1 << self.columns) - 1
+
+    def add(self, x, y, mask):
+        # Maschera con origine nel pixel (x, y): se non cade sul bordo di una cella copre anche la successiva
+        column, row = int(x // self.cell), int(y // self.cell)
+        straddle_x, straddle_y = x % self.cell != 0, y % self.cell != 0
+        for index, bits in enumerate(mask):
+            if straddle_x:
+                bits |= bits << 1
+            bits = (bits << column if column >= 0 else bits >> -column) & self._full_row
+            for target in (row + index, row + index + 1) if straddle_y else (row + index,):
+                if 0 <= target < len(self.rows):
+                    self.rows[target] |= bits
+
+    def add_box(self, box):
+        first_column, last_column = max(0, int(box.x // self.cell)), min(self.columns, math.ceil(box.right / self.cell))
+        if last_column <= first_column:
+            return
+        bits = ((1 << (last_column - first_column)) - 1) << first_column
+        for row in range(max(0, int(box.y // self.cell)), min(len(self.rows), math.ceil(box.bottom / self.cell))):
+            self.rows[row] |= bits
+
+    def dilated(self, cells):
+        # Occupazione allargata di `cells` celle in ogni direzione: un oggetto e' a distanza sufficiente
+        # dagli altri se la sua maschera non tocca questa versione (invece di allargare ogni maschera)
+        if cells <= 0:
+            return self.rows
+        widened = [spread_right(bits << cells, 2 * cells + 1) & self._full_row for bits in self.rows]
+        padded = [0] * cells + widened + [0] * cells
+        dilated = []
+        for row in range(len(self.rows)):
+            bits = 0
+            for source in padded[row:row + 2 * cells + 1]:
+                bits |= source
+            dilated.append(bits)
+        return dilated
+
+    def free_positions(self, mask, spacing_cells, bounds, width, height):
+        """Posizioni libere (x, y) in pixel, allineate alle celle, per un oggetto w x h con maschera `mask`.
+
+        bounds: (x_start, y_start, x_end, y_end) in pixel, l'oggetto intero deve starci dentro.
+        Gli altri oggetti vengono allargati di `spacing_cells` celle: la distanza minima tra oggetti.
+        Per ogni riga candidata le colonne vietate si calcolano su tutta la riga in una volta.
+        """
+        x_start, y_start, x_end, y_end = bounds
+        first_column, last_column = math.ceil(x_start / self.cell), math.floor((x_end - width) / self.cell)
+        first_row, last_row = math.ceil(y_start / self.cell), math.floor((y_end - height) / self.cell)
+        if last_column < first_column or last_row < first_row:
+            return []
+        allowed_columns = ((1 << (last_column - first_column + 1)) - 1) << first_column
+        occupied = self.dilated(spacing_cells)
+        # Scarto immediato: nell'area ci sono meno celle libere di quante ne occupi la maschera
+        area_columns = ((1 << (math.floor(x_end / self.cell) - first_column)) - 1) << first_column
+        free_cells = sum((area_columns & ~bits).bit_count() for bits in occupied[first_row:math.floor(y_end / self.cell)])
+        if free_cells < sum(bits.bit_count() for bits in mask):
+            return []
+        # Prima le righe piu' piene: bloccano piu' colonne e fanno terminare prima le righe senza posto
+        mask_runs = sorted(((index, row_runs(bits)) for index, bits in enumerate(mask) if bits),
+                           key=lambda item: -sum(length for _, length in item[1]))
+        spread_cache = {}
+        positions = []
+        for row in range(first_row, last_row + 1):
+            forbidden = 0
+            for index, runs in mask_runs:
+                frame_row = row + index
+                if not occupied[frame_row]:
+                    continue
+                for start, length in runs:
+                    key = (frame_row, length)
+                    spread = spread_cache.get(key)
+                    if spread is None:
+                        spread = spread_cache[key] = spread_right(occupied[frame_row], length)
+                    forbidden |= spread >> start
+                if forbidden & allowed_columns == allowed_columns:
+                    break
+            free = allowed_columns & ~forbidden
+            while free:
+                lowest = free & -free
+                positions.append(((lowest.bit_length() - 1) * self.cell, row * self.cell))
+                free ^= lowest
+        return positions
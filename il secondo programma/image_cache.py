@@ -0,0 +1,170 @@
+import os
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+
+def image_nbytes(img):
+    # Stima della memoria occupata dai pixel decodificati
+    return img.width * img.height * len(img.getbands())
+
+
+class SpriteCache:
+    """Cache LRU con budget in byte per immagini gia' decodificate, orientate e ridimensionate.
+
+    Le chiavi sono (path, mtime, max_w, max_h): un file modificato produce una chiave nuova
+    e la vecchia voce esce per LRU. Le immagini restituite sono condivise e non vanno modificate.
+    sizeof: stima in byte di una voce, per usare la cache anche con valori che non sono Image.
+    """
+
+    def __init__(self, max_bytes, sizeof=image_nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        size = self.sizeof(img)
+        if size > self.max_bytes:
+            return img
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= self.sizeof(old)
+            self._entries[key] = img
+            self.current_bytes += size
+            evicted_items = []
+            while self.current_bytes > self.max_bytes and self._entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self.sizeof(evicted)
+                self.evictions += 1
+                evicted_items.append((evicted_key, evicted))
+        for evicted_key, evicted in evicted_items:
+            self._on_evict(evicted_key, evicted)
+        return img
+
+    def _on_evict(self, key, img):
+        pass
+
+    def get_or_load(self, key, loader):
+        img = self.get(key)
+        if img is None:
+            img = self.put(key, loader())
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FramePool:
+    """Frame a piena risoluzione riusati per tutto un batch, uno per (modo, dimensioni).
+
+    Il chiamante sovrascrive ogni pixel del frame (paste dello sfondo) prima di usarlo e non
+    deve tenerlo oltre l'outfit corrente. new_frame(mode, size) crea i frame (default Image.new):
+    il compositore NumPy ne fornisce uno i cui pixel sono un array su cui lavora direttamente.
+    """
+
+    def __init__(self, new_frame=None):
+        self.new_frame = new_frame or Image.new
+        self._frames = {}
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, mode, size):
+        frame = self._frames.get((mode, size))
+        if frame is None:
+            frame = self.new_frame(mode, size)
+            self._frames[(mode, size)] = frame
+            self.allocations += 1
+        else:
+            self.reuses += 1
+        return frame
+
+    def clear(self):
+        self._frames.clear()
+
+
+class BackgroundCache(SpriteCache):
+    """Cache degli sfondi gia' ridimensionati, sfocati e schiariti, pronti per il paste.
+
+    Chiavi (path, mtime, width, height, blur, brightness). Con spill_dir le voci espulse dalla
+    memoria vengono scritte su disco come pixel grezzi e ricaricate al posto di rielaborarle.
+    """
+
+    _SPILL_HEADER = struct.Struct("<4sII")  # modo (padded), larghezza, altezza
+
+    def __init__(self, max_bytes, spill_dir=None):
+        super().__init__(max_bytes)
+        self.spill_dir = spill_dir
+        self.spill_hits = 0
+
+    def get(self, key):
+        img = super().get(key)
+        if img is None and self.spill_dir:
+            img = self._read_spill(key)
+            if img is not None:
+                self.spill_hits += 1
+                self.put(key, img)
+        return img
+
+    def stats(self):
+        stats = super().stats()
+        stats["spill_hits"] = self.spill_hits
+        return stats
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:24] + ".raw")
+
+    def _on_evict(self, key, img):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self._SPILL_HEADER.pack(img.mode.encode("ascii"), img.width, img.height))
+                f.write(img.tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"DEBUG: Impossibile salvare lo sfondo in cache su disco: {e}")
+
+    def _read_spill(self, key):
+        path = self._spill_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                mode, width, height = self._SPILL_HEADER.unpack(f.read(self._SPILL_HEADER.size))
+                return Image.frombytes(mode.rstrip(b"\0").decode("ascii"), (width, height), f.read())
+        except (OSError, ValueError, struct.error) as e:
+            print(f"DEBUG: Cache su disco dello sfondo illeggibile ({path}): {e}")
+            return None
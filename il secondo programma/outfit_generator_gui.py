@@ -1,3 +1,5 @@
+import os
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, colorchooser
 from outfit_generator_logic import OutfitGeneratorLogic
@@ -22,6 +24,7 @@ class OutfitGeneratorApp:
         self.folders_visible = tk.BooleanVar(value=True)
 
         self.create_widgets()
+        self.start_warm_up()
 
     def create_widgets(self):
         main_frame = tk.Frame(self.root, bg="#f0f0f0")
@@ -239,6 +242,36 @@ class OutfitGeneratorApp:
         generate_frame.pack(fill="x", pady=20)
         self.generate_btn = tk.Button(generate_frame, text="🚀 Genera Outfit", bg="#4CAF50", fg="white", font=("Helvetica", 16, "bold"), command=self.generate_outfits)
         self.generate_btn.pack()
+        self.warm_up_label = tk.Label(generate_frame, text="", bg="#f0f0f0", fg="#666666")
+        self.warm_up_label.pack(pady=5)
+
+    def start_warm_up(self):
+        # Prepara sprite e sfondi in background; lo stato viene letto dal thread Tk con after()
+        progress = {"done": 0, "total": 0}
+
+        def on_progress(done, total):
+            progress["done"], progress["total"] = done, total
+
+        folders = {item: self.logic.get_category_path(item) for item in self.logic.accessory_types}
+        warm_up_thread = threading.Thread(target=self.logic.warm_up, kwargs={
+            "size_main_factor": self.size_main_slider.get() / 100,
+            "size_accessory_factor": self.size_accessory_slider.get() / 100,
+            "blur_value": self.blur_slider.get(),
+            "brightness_value": self.brightness_slider.get(),
+            "folders": folders,
+            "progress_callback": on_progress,
+        }, daemon=True)
+        warm_up_thread.start()
+
+        def poll():
+            if warm_up_thread.is_alive():
+                if progress["total"]:
+                    self.warm_up_label.config(text=f"⏳ Preparazione catalogo: {progress['done']}/{progress['total']}")
+                self.root.after(200, poll)
+            else:
+                self.warm_up_label.config(text=f"✅ Catalogo pronto ({progress['total']} immagini)")
+
+        poll()
 
     def toggle_folders(self):
         if self.folders_visible.get():
@@ -1,10 +1,25 @@
 import os
+import sys
+import math
 import random
 import json
-import tkinter as tk
-from tkinter import messagebox, colorchooser
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter, ExifTags, ImageStat
+from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter, ImageStat, PngImagePlugin
 import traceback
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from asset_catalog import AssetCatalog, EXIF_ORIENTATION_TAG, apply_orientation, open_oriented
+from image_cache import SpriteCache, BackgroundCache, FramePool
+from sprite_store import open_raw_sprite
+from numpy_compositor import NumpyCompositor, numpy_available
+from png_writer import StreamingPNGWriter
+from spatial_index import OccupancyGrid, FreeRectangles
+from collision_mask import ALPHA_THRESHOLD, alpha_mask_rows, mask_nbytes
+from outfit_model import RenderSettings, AccessoryRule, Scene, Background, Layer, Label, Watermark, Box, Zone, Frame
+
+
+class OutfitGenerationError(Exception):
+    """Configurazione non valida per il render (cartelle mancanti, output non valido...)."""
+
 
 class OutfitGeneratorLogic:
     TARGET_WIDTH = 1080
@@ -12,16 +27,32 @@ class OutfitGeneratorLogic:
     ACCESSORY_MARGIN = 100  # General margin for accessories from canvas edges
     WATERMARK_MARGIN_TOP = 100
     WATERMARK_MARGIN_BOTTOM_TIKTOK = 200
-    ACCESSORY_PRIORITIES = {
-       "scarpe": 1, "occhiali": 1, # Highest priority
-       "cinture": 2, "orologi": 2,
-       "bracciali": 3,
-       "wallet": 4, "profumi": 4, # Lower priority
-       "auto": 5 # Lowest, or handle separately due to size
+    FONT_SIZE = 30  # Dimensione dei nomi sul formato di riferimento
+    # Punti di ancoraggio delle regole di accessory_rules.json -> metodo che calcola il punto preferito
+    ACCESSORY_ANCHORS = {
+        "above_shirt": "anchor_above_shirt", "waist": "anchor_waist", "below_pants": "anchor_below_pants",
+        "largest_zone": "anchor_largest_zone", "garment_edge": "anchor_garment_edge", "free": None,
     }
-    DEFAULT_PRIORITY = 10
+    PLACEMENT_FALLBACKS = ("zones", "content_area", "alpha_mask")
     MIN_CONTRAST_THRESHOLD = 2.0
     MIN_TEXT_CONTRAST_THRESHOLD = 3.0
+    SPRITE_CACHE_BYTES = 256 * 1024 * 1024  # Budget della cache degli sprite ridimensionati
+    MAX_SIZE_FACTOR = 2.0  # Valore massimo degli slider di grandezza (200%)
+    BACKGROUND_CACHE_BYTES = 128 * 1024 * 1024  # Budget degli sfondi gia' elaborati (circa 20 frame RGB 1080x1920)
+    SOLID_BACKGROUND_CACHE_BYTES = 64 * 1024 * 1024  # Frame a tinta unita, uno per colore/luminosita'
+    COLLISION_MASK_CACHE_BYTES = 16 * 1024 * 1024  # Maschere di collisione, una per asset e dimensione
+    HEADER_SIZE_CACHE_BYTES = 1024 * 1024  # Dimensioni lette dagli header dei file fuori catalogo
+    NUMPY_SPRITE_CACHE_BYTES = 128 * 1024 * 1024  # Sprite premoltiplicati del compositore NumPy (10 byte per pixel)
+    BACKGROUND_REDUCING_GAP = 3.0  # Riduzione intera (reduce) prima del LANCZOS per sfondi non JPEG
+    MAX_LAYOUT_ATTEMPTS = 20  # Layout scartati da layout_filter prima di accettare l'ultimo
+    DRAFT_RESAMPLE = Image.Resampling.BILINEAR  # Filtro delle bozze di anteprima
+    PREVIEW_DRAFT_FACTOR = 2  # L'anteprima viene mostrata ridotta: basta meta' risoluzione
+    TILED_RENDER_PIXELS = 3840 * 2160  # Da questa area (4K) in su i file vengono renderizzati a strisce
+    TILED_STRIP_HEIGHT = 512  # Righe per striscia nel render a strisce
+    OCCUPANCY_CELL_SIZE = 120  # Lato delle celle dell'indice delle aree occupate (pixel di riferimento)
+    COLLISION_CELL = 8  # Celle della maschera di collisione alpha (pixel di riferimento: 1/8 di risoluzione)
+    ALPHA_SAMPLE_SIZE = 128  # Lato massimo dell'alpha ridotto da cui si ricavano le maschere di collisione
+    SEED_METADATA_KEY = "outfit_generator"  # Chiave del testo PNG / commento JPG con i seed dell'outfit
 
     def __init__(self):
         script_dir = os.path.dirname(os.path.realpath(__file__))
@@ -35,15 +66,36 @@ class OutfitGeneratorLogic:
         self.watermark_path = "/Users/grigolausss/Desktop/WhisperMind/logo/logo nuovo senza sfondo.PNG"
         self.fonts_path = os.path.normpath(os.path.join(script_dir, "..", "fonts"))
         self.palette_file = "custom_background_palette.json" # Relative to script/execution dir
+        self.catalog_file = "asset_catalog.sqlite3" # Indice persistente degli asset, relativo come palette_file
+        self.derivatives_path = "asset_derivatives" # Asset ritagliati e normalizzati prodotti dall'ingest
+        self.use_raw_sprite_store = False # Se True l'ingest scrive anche sprite RGBA grezzi letti via mmap
+        self.use_numpy_compositor = False # Se True (e numpy e' installato) compone i livelli in un solo passaggio NumPy
+
+        # Regole degli accessori (ancoraggio, grandezza, priorita'): lette una volta, una categoria per regola
+        self.accessory_rules_file = os.path.join(script_dir, "accessory_rules.json")
+        self.accessory_rules = self.load_accessory_rules()
+        self._placement_plans = self.compile_accessory_rules(self.accessory_rules)
 
         # Categorie di immagini
-        self.accessory_types = ["maglie", "pantaloni", "occhiali", "wallet", "profumi", 
-                                "bracciali", "orologi", "cinture", "scarpe", "auto", "sfondi"]
+        self.accessory_types = ["maglie", "pantaloni"] + list(self.accessory_rules) + ["sfondi"]
         self.category_paths = {item: os.path.join(self.base_path, item.lower()) for item in self.accessory_types}
+        self.catalog = AssetCatalog(self.catalog_file)
+        self.sprite_cache = SpriteCache(self.SPRITE_CACHE_BYTES)
+        # Impostare background_spill_path su una cartella per salvare su disco gli sfondi espulsi dalla memoria
+        self.background_spill_path = None
+        self.background_cache = BackgroundCache(self.BACKGROUND_CACHE_BYTES, self.background_spill_path)
+        self.solid_background_cache = SpriteCache(self.SOLID_BACKGROUND_CACHE_BYTES)
+        self._header_sizes = SpriteCache(self.HEADER_SIZE_CACHE_BYTES, sizeof=sys.getsizeof) # (path, mtime) -> dimensioni orientate
+        self._numpy_compositor = None
+        self._brightness_luts = {} # luminosita' -> tabella point() equivalente a ImageEnhance.Brightness
+        # (path, mtime, colonne, righe) -> righe della maschera di collisione; gli alpha ridotti da cui
+        # si ricavano stanno nella sprite_cache insieme agli sprite
+        self._collision_masks = SpriteCache(self.COLLISION_MASK_CACHE_BYTES, sizeof=mask_nbytes)
 
         # Font
         self.available_fonts = []
         self.font_objects = {}
+        self._loaded_fonts = {} # (nome, dimensione) -> ImageFont gia' caricato
         self.load_fonts()
 
         # Palette di colori
@@ -58,18 +110,15 @@ class OutfitGeneratorLogic:
 
     def load_fonts(self):
         if not os.path.exists(self.fonts_path):
-            messagebox.showwarning("Attenzione", f"La cartella dei font {self.fonts_path} non esiste. Creala e aggiungi i file .ttf.")
+            print(f"Warning: La cartella dei font {self.fonts_path} non esiste. Creala e aggiungi i file .ttf.")
             return
         self.available_fonts = ["Random"]
-        for file in os.listdir(self.fonts_path):
+        for file in sorted(os.listdir(self.fonts_path)): # Ordine stabile: lo stesso seed sceglie lo stesso font
             if file.lower().endswith(".ttf"):
                 font_path = os.path.join(self.fonts_path, file)
                 font_name = os.path.splitext(file)[0]
                 self.available_fonts.append(font_name)
-                try:
-                    self.font_objects[font_name] = font_path
-                except Exception as e:
-                    messagebox.showwarning("Attenzione", f"Errore nel caricamento del font {font_name}: {e}")
+                self.font_objects[font_name] = font_path # Il file viene aperto solo in load_font
 
     def load_background_palette(self):
         if os.path.exists(self.palette_file):
@@ -78,14 +127,47 @@ class OutfitGeneratorLogic:
                     loaded_palette = json.load(f)
                     self.background_palette = [tuple(color) for color in loaded_palette]
             except Exception as e:
-                messagebox.showwarning("Attenzione", f"Errore nel caricamento della tavolozza degli sfondi: {e}")
+                print(f"Warning: Errore nel caricamento della tavolozza degli sfondi: {e}")
+
+    def load_accessory_rules(self):
+        # {categoria: AccessoryRule} nell'ordine del file; regole non valide vengono segnalate e saltate
+        try:
+            with open(self.accessory_rules_file, "r", encoding="utf-8") as f:
+                raw_rules = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Regole degli accessori non caricate da {self.accessory_rules_file}: {e}")
+            return {}
+        rules = {}
+        for category, raw in raw_rules.items():
+            try:
+                rule = AccessoryRule(category, **raw)
+                rule.size = tuple(float(value) for value in rule.size)
+                rule.priority = int(rule.priority) # Confrontata con le altre nell'ordinamento di solve_layout
+                rule.fallback = tuple(rule.fallback)
+                if len(rule.size) != 2 or rule.anchor not in self.ACCESSORY_ANCHORS:
+                    raise ValueError(f"anchor '{rule.anchor}' o size {rule.size} non validi")
+                if any(fallback not in self.PLACEMENT_FALLBACKS for fallback in rule.fallback):
+                    raise ValueError(f"fallback {rule.fallback} non validi")
+            except (TypeError, ValueError) as e:
+                print(f"Warning: Regola per '{category}' ignorata: {e}")
+                continue
+            rules[category] = rule
+        return rules
+
+    def compile_accessory_rules(self, rules):
+        # categoria -> (regola, metodo di ancoraggio o None per "free"): nessuna ricerca per nome durante il layout
+        return {category: (rule, getattr(self, self.ACCESSORY_ANCHORS[rule.anchor]) if self.ACCESSORY_ANCHORS[rule.anchor] else None)
+                for category, rule in rules.items()}
 
     def save_background_palette(self):
+        # False se il file non si puo' scrivere: la GUI mostra l'errore
         try:
             with open(self.palette_file, 'w') as f:
                 json.dump(self.background_palette, f, indent=4)
         except Exception as e:
-            messagebox.showerror("Errore", f"Errore nel salvataggio della tavolozza degli sfondi: {e}")
+            print(f"Warning: Errore nel salvataggio della tavolozza degli sfondi: {e}")
+            return False
+        return True
 
     def get_unique_filename(self, base_path, filename):
         base_name, ext = os.path.splitext(filename)
@@ -98,59 +180,264 @@ class OutfitGeneratorLogic:
             counter += 1
         return new_filename
 
-    def fix_image_orientation(self, img):
-        try:
-            exif = img._getexif()
-            if exif is None:
-                return img
-            for tag_id, value in exif.items():
-                if ExifTags.TAGS.get(tag_id) == "Orientation":
-                    if value == 3:
-                        img = img.rotate(180, expand=True)
-                    elif value == 6:
-                        img = img.rotate(270, expand=True)
-                    elif value == 8:
-                        img = img.rotate(90, expand=True)
-                    break
-        except Exception:
-            pass
-        return img
-
     def safe_randint(self, start, end):
         if end < start:
             return start
         return random.randint(start, end)
 
+    def get_category_path(self, category):
+        # La GUI sostituisce i percorsi con le Entry: accetta sia stringhe che widget
+        path = self.category_paths.get(category)
+        if path is not None and hasattr(path, "get"):
+            path = path.get()
+        return path
+
     def load_images_from_folder(self, folder_path):
-        valid_extensions = (".png", ".jpg", ".jpeg", ".PNG", ".JPG", ".JPEG")
-        images = []
-        if not os.path.exists(folder_path):
+        # Restituisce AssetRecord (path, name, ...) dal catalogo: rilegge solo i file modificati
+        if not folder_path or not os.path.exists(folder_path):
             print(f"DEBUG: La cartella {folder_path} non esiste.")
-            return images
-        for file in os.listdir(folder_path):
-            if file.lower().endswith(valid_extensions):
-                full_path = os.path.join(folder_path, file)
-                images.append((full_path, os.path.splitext(file)[0]))
-        return images
-
-    def resize_image(self, image, max_width, max_height):
-        image.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            return []
+        return self.catalog.scan(folder_path)
+
+    def load_category_images(self):
+        # Una sola scansione per categoria per ogni generazione
+        category_images = {category: self.load_images_from_folder(self.get_category_path(category)) for category in self.accessory_types}
+        for category, records in category_images.items():
+            if category != "sfondi":
+                category_images[category] = self.ingest_assets(category, records)
+        return category_images
+
+    def max_sprite_size(self, category):
+        # Dimensione piu' grande che uno slider puo' richiedere per la categoria
+        content_width = self.TARGET_WIDTH - 2 * self.ACCESSORY_MARGIN
+        content_height = self.TARGET_HEIGHT - 2 * self.ACCESSORY_MARGIN
+        if category in ("maglie", "pantaloni"):
+            return (int(content_width * 0.5 * self.MAX_SIZE_FACTOR), int(content_height * 0.35 * self.MAX_SIZE_FACTOR))
+        size_rules = self.accessory_rules.get(category, AccessoryRule(category)).size
+        # generate_outfits applica il fattore accessori due volte: la derivata deve coprire anche quel caso
+        factor = self.MAX_SIZE_FACTOR * self.MAX_SIZE_FACTOR
+        return (int(content_width * size_rules[0] * factor), int(content_height * size_rules[1] * factor))
+
+    def frame(self, width=None, height=None):
+        # Geometria del canvas; senza argomenti il formato di riferimento TARGET_WIDTH x TARGET_HEIGHT
+        frame = Frame(width or self.TARGET_WIDTH, height or self.TARGET_HEIGHT,
+                      self.TARGET_WIDTH, self.TARGET_HEIGHT, self.ACCESSORY_MARGIN)
+        if frame.content_width <= 0 or frame.content_height <= 0:
+            raise OutfitGenerationError(f"Risoluzione {frame.width}x{frame.height} non valida.")
+        return frame
+
+    def main_item_max_size(self, size_main_factor, frame=None):
+        frame = frame or self.frame()
+        return int(frame.content_width * 0.5 * size_main_factor), int(frame.content_height * 0.35 * size_main_factor)
+
+    def accessory_max_size(self, category, size_main_factor, size_accessory_factor, frame=None):
+        # Formula di generate_outfits: le regole vengono scalate e poi moltiplicate ancora per il fattore accessori
+        frame = frame or self.frame()
+        content_width, content_height = frame.content_width, frame.content_height
+        if category in self.accessory_rules:
+            rule = self.accessory_rules[category].size
+            size_rules = (rule[0] * size_accessory_factor, rule[1] * size_main_factor)
+        else:
+            size_rules = AccessoryRule(category).size
+        return int(content_width * size_rules[0] * size_accessory_factor), int(content_height * size_rules[1] * size_accessory_factor)
+
+    def warm_up(self, size_main_factor, size_accessory_factor, blur_value, brightness_value, folders=None, progress_callback=None, max_workers=None):
+        # Decodifica e ridimensiona in anticipo tutto il catalogo su un pool di thread (Pillow rilascia
+        # il GIL durante decodifica e ricampionamento), riempiendo le cache di sprite e sfondi.
+        # folders: {categoria: cartella} gia' letti dal thread Tk, perche' i widget non vanno toccati da altri thread.
+        if folders is None:
+            folders = {category: self.get_category_path(category) for category in self.accessory_types}
+        tasks = []
+        for category in self.accessory_types:
+            records = self.load_images_from_folder(folders.get(category))
+            if category == "sfondi":
+                for record in records:
+                    tasks.append((record, lambda r: self.get_processed_background(r, self.TARGET_WIDTH, self.TARGET_HEIGHT, blur_value, brightness_value)))
+                continue
+            if category in ("maglie", "pantaloni"):
+                max_size = self.main_item_max_size(size_main_factor)
+            else:
+                max_size = self.accessory_max_size(category, size_main_factor, size_accessory_factor)
+            ingest_size = self.max_sprite_size(category)
+            for record in records:
+                tasks.append((record, lambda r, max_size=max_size, ingest_size=ingest_size: self.load_sprite(
+                    self.catalog.ingest(r, self.derivatives_path, ingest_size, self.use_raw_sprite_store), max_size[0], max_size[1])))
+
+        total = len(tasks)
+        done = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(task, record): record for record, task in tasks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"DEBUG: Warm-up fallito per {futures[future].path}: {e}")
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+                elif done == total or done % max(1, total // 10) == 0:
+                    print(f"DEBUG: Warm-up catalogo {done}/{total}")
+        return total
+
+    def ingest_assets(self, category, records):
+        # Ritaglio al bbox alpha + derivata normalizzata, solo per gli asset nuovi o modificati
+        max_size = self.max_sprite_size(category)
+        return [self.catalog.ingest(record, self.derivatives_path, max_size, self.use_raw_sprite_store) for record in records]
+
+    def resize_image(self, image, max_width, max_height, resample=Image.Resampling.LANCZOS):
+        image.thumbnail((max_width, max_height), resample)
         return image
 
-    def neutral_background(self, width, height):
-        bg_color = random.choice(self.background_palette)
-        return Image.new("RGBA", (width, height), bg_color)
-
-    def is_position_safe(self, x, y, item_w, item_h):
-        safe_left = self.ACCESSORY_MARGIN
-        safe_top = self.ACCESSORY_MARGIN
-        safe_right = self.TARGET_WIDTH - self.ACCESSORY_MARGIN
-        safe_bottom = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN
-
-        return (x >= safe_left and x + item_w <= safe_right and
-                y >= safe_top and y + item_h <= safe_bottom)
+    def master_crop(self, image_data, max_width, max_height):
+        # La derivata e' dimensionata per il formato di riferimento: se un frame piu' grande (master 4K)
+        # la ingrandirebbe, si usa l'originale ritagliato al bbox. Restituisce il bbox o None.
+        derivative_size = getattr(image_data, "derivative_size", None)
+        bbox = getattr(image_data, "bbox", None)
+        if not derivative_size or not bbox:
+            return None
+        bbox_width, bbox_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        if (derivative_size[0] < max_width and derivative_size[1] < max_height and
+                bbox_width > derivative_size[0] and bbox_height > derivative_size[1]):
+            return bbox
+        return None
+
+    def load_sprite(self, image_data, max_width, max_height, resample=Image.Resampling.LANCZOS):
+        # image_data: AssetRecord dal catalogo oppure un percorso. L'immagine restituita e' condivisa: non modificarla.
+        return self.sprite_cache.get_or_load(*self.sprite_key(image_data, max_width, max_height, resample))
+
+    def sprite_key(self, image_data, max_width, max_height, resample=Image.Resampling.LANCZOS):
+        # (chiave della SpriteCache, funzione che decodifica lo sprite) per load_sprite
+        # Le bozze (ricampionamento diverso da LANCZOS) hanno chiavi proprie
+        quality = () if resample == Image.Resampling.LANCZOS else (resample,)
+        crop = self.master_crop(image_data, max_width, max_height)
+        if crop:
+            key = (image_data.path, image_data.mtime, crop, max_width, max_height) + quality
+            return key, lambda: self.resize_image(open_oriented(image_data.path).crop(crop), max_width, max_height, resample)
+        path, mtime = self.asset_file(image_data, render=True)
+        opener = open_oriented
+        raw_path = getattr(image_data, "raw", None)
+        if raw_path and self.use_raw_sprite_store and os.path.exists(raw_path):
+            # Sprite grezzo via mmap: nessuna decodifica PNG, solo l'eventuale ricampionamento
+            path, opener = raw_path, open_raw_sprite
+        key = (path, mtime, max_width, max_height) + quality
+        return key, lambda: self.resize_image(opener(path), max_width, max_height, resample)
+
+    def asset_file(self, image_data, render=False):
+        """(percorso, mtime) di un asset passato come AssetRecord, tupla (path, name) o percorso.
+
+        Con render=True il percorso e' il file da decodificare (la derivata, se il catalogo ne ha una).
+        L'mtime e' quello dell'originale registrato nel catalogo, altrimenti letto dal disco.
+        """
+        path = getattr(image_data, "render_path", None) if render else None
+        if path is None:
+            path = image_data[0] if isinstance(image_data, tuple) else image_data
+        mtime = getattr(image_data, "mtime", None)
+        if mtime is None:
+            mtime = os.path.getmtime(path)
+        return path, mtime
+
+    def load_background(self, background_path, width, height, resample=Image.Resampling.LANCZOS):
+        # JPEG: draft() fa decodificare al decoder la scala DCT (1/2, 1/4, 1/8) piu' piccola che copre
+        # ancora width x height; gli altri formati passano da reduce() tramite reducing_gap.
+        # In entrambi i casi segue un solo ricampionamento LANCZOS.
+        background = self.open_background_source(background_path, width, height)
+        if background.size != (width, height):
+            background = background.resize((width, height), resample, reducing_gap=self.BACKGROUND_REDUCING_GAP)
+        return background
+
+    def open_background_source(self, background_path, width, height):
+        # Foto di sfondo decodificata (RGB, orientata) alla scala draft piu' piccola che copre width x height
+        with Image.open(background_path) as img:
+            orientation = img.getexif().get(EXIF_ORIENTATION_TAG)
+            # La draft lavora nel verso del file, prima della rotazione EXIF
+            draft_size = (height, width) if orientation in (6, 8) else (width, height)
+            img.draft("RGB", draft_size)
+            background = img.convert("RGB")
+        return apply_orientation(background, orientation)
+
+    def fitted_size(self, width, height, max_width, max_height):
+        # Dimensione prodotta da Image.thumbnail((max_width, max_height)), calcolata senza pixel
+        x, y = math.floor(max_width), math.floor(max_height)
+        if x >= width and y >= height:
+            return width, height
+        aspect = width / height
+        if x / y >= aspect:
+            x = max(min(math.floor(y * aspect), math.ceil(y * aspect), key=lambda n: abs(aspect - n / y)), 1)
+        else:
+            y = max(min(math.floor(x / aspect), math.ceil(x / aspect), key=lambda n: 0 if n == 0 else abs(aspect - x / n)), 1)
+        return x, y
+
+    def source_size(self, image_data):
+        # Dimensioni orientate dell'immagine da decodificare: dal catalogo, altrimenti dal solo header
+        if hasattr(image_data, "render_size"):
+            return image_data.render_size
+        key = self.asset_file(image_data)
+        return self._header_sizes.get_or_load(key, lambda: self.header_size(key[0]))
+
+    def header_size(self, path):
+        with Image.open(path) as img:
+            size = img.size
+            if img.getexif().get(EXIF_ORIENTATION_TAG) in (6, 8):
+                size = (size[1], size[0])
+        return size
+
+    def sprite_size(self, image_data, max_width, max_height):
+        # Dimensione dello sprite che load_sprite restituirebbe, senza decodificare
+        crop = self.master_crop(image_data, max_width, max_height)
+        if crop:
+            return self.fitted_size(crop[2] - crop[0], crop[3] - crop[1], max_width, max_height)
+        width, height = self.source_size(image_data)
+        return self.fitted_size(width, height, max_width, max_height)
+
+    def apply_background_effects(self, background, blur_value, brightness_value):
+        if blur_value > 0:
+            background = background.filter(ImageFilter.GaussianBlur(blur_value))
+        if brightness_value == 0:
+            return background
+        # Una sola tabella point() invece di ImageEnhance (frame nero + blend): un frame allocato in meno
+        return background.point(self.brightness_lut(brightness_value) * len(background.getbands()))
+
+    def brightness_lut(self, brightness_value):
+        # Tabella calcolata facendo passare un gradiente 0-255 da ImageEnhance.Brightness: risultato identico
+        lut = self._brightness_luts.get(brightness_value)
+        if lut is None:
+            gradient = Image.new("L", (256, 1))
+            gradient.putdata(range(256))
+            lut = list(ImageEnhance.Brightness(gradient).enhance(1 + brightness_value / 100).getdata())
+            self._brightness_luts[brightness_value] = lut
+        return lut
+
+    def get_processed_background(self, background_data, width, height, blur_value, brightness_value, resample=Image.Resampling.LANCZOS):
+        # Sfondo foto ridimensionato + sfocatura + luminosita', calcolato una volta per combinazione di slider
+        path, mtime = self.asset_file(background_data)
+        self.background_cache.spill_dir = self.background_spill_path
+        key = (path, mtime, width, height, blur_value, brightness_value)
+        if resample != Image.Resampling.LANCZOS:
+            key += (resample,)
+        return self.background_cache.get_or_load(key, lambda: self.apply_background_effects(
+            self.load_background(path, width, height, resample), blur_value, brightness_value))
+
+    def print_cache_stats(self):
+        for label, cache in (("Sprite", self.sprite_cache), ("Sfondi", self.background_cache)):
+            stats = cache.stats()
+            print(f"DEBUG: {label} cache - hit: {stats['hits']}, miss: {stats['misses']}, evicted: {stats['evictions']}, "
+                  f"{stats['entries']} immagini, {stats['bytes'] / (1024 * 1024):.1f}/{stats['max_bytes'] / (1024 * 1024):.0f} MB")
+
+    def adjusted_background_color(self, bg_color, brightness_value):
+        # Stesso ImageEnhance.Brightness del percorso completo, su un solo pixel: risultato identico
+        pixel = Image.new("RGBA", (1, 1), tuple(bg_color))
+        return ImageEnhance.Brightness(pixel).enhance(1 + brightness_value / 100).getpixel((0, 0))
+
+    def solid_background(self, bg_color, width, height, brightness_value):
+        # Su una tinta unita la sfocatura non cambia nulla e la luminosita' da' ancora una tinta unita:
+        # il colore finale si calcola direttamente e il frame viene riusato (condiviso, non modificarlo)
+        key = (tuple(bg_color), width, height, brightness_value)
+        return self.solid_background_cache.get_or_load(key, lambda: Image.new(
+            "RGBA", (width, height), self.adjusted_background_color(bg_color, brightness_value)))
 
     def open_palette_manager(self, root, selected_font_color_rgb):
+        import tkinter as tk # Solo per la GUI: la logica si puo' usare senza display
+        from tkinter import messagebox, colorchooser
         palette_window = tk.Toplevel(root)
         palette_window.title("Gestisci Tavolozza Font")
         palette_window.geometry("300x400")
@@ -193,6 +480,8 @@ class OutfitGeneratorLogic:
         update_palette_display()
 
     def open_background_palette_manager(self, root):
+        import tkinter as tk
+        from tkinter import messagebox, colorchooser
         palette_window = tk.Toplevel(root)
         palette_window.title("Gestisci Tavolozza Sfondi")
         palette_window.geometry("300x400")
@@ -200,6 +489,10 @@ class OutfitGeneratorLogic:
         palette_frame = tk.Frame(palette_window)
         palette_frame.pack(fill="both", expand=True, padx=10, pady=10)
 
+        def save_palette():
+            if not self.save_background_palette():
+                messagebox.showerror("Errore", "Errore nel salvataggio della tavolozza degli sfondi.")
+
         def update_palette_display():
             for widget in palette_frame.winfo_children():
                 widget.destroy()
@@ -216,20 +509,20 @@ class OutfitGeneratorLogic:
             color = colorchooser.askcolor(title="Aggiungi Colore")[0]
             if color:
                 self.background_palette.append((int(color[0]), int(color[1]), int(color[2])))
-                self.save_background_palette()
+                save_palette()
                 update_palette_display()
 
         def modify_color(idx):
             color = colorchooser.askcolor(title="Modifica Colore", initialcolor=self.background_palette[idx])[0]
             if color:
                 self.background_palette[idx] = (int(color[0]), int(color[1]), int(color[2]))
-                self.save_background_palette()
+                save_palette()
                 update_palette_display()
 
         def remove_color(idx):
             if len(self.background_palette) > 1:
                 self.background_palette.pop(idx)
-                self.save_background_palette()
+                save_palette()
                 update_palette_display()
             else:
                 messagebox.showwarning("Attenzione", "Deve esserci almeno un colore nella tavolozza!")
@@ -241,464 +534,840 @@ class OutfitGeneratorLogic:
         max_accessories = len([cat for cat in self.accessory_types if cat not in ["maglie", "pantaloni", "sfondi"]])
         accessory_slider.set(self.safe_randint(2, max_accessories))
 
+    def settings_from_widgets(self, width_entry, height_entry, show_names, use_watermark, watermark_path_var, watermark_position, selected_font, blur_value, brightness_value, spacing_value, size_main_value, size_accessory_value, accessory_count_value, object_spacing_value, font_color_rgb, format_combo=None):
+        # Legge i widget una sola volta: da qui in poi il render lavora solo su valori semplici
+        return RenderSettings(
+            width=int(width_entry.get()),
+            height=int(height_entry.get()),
+            blur=blur_value,
+            brightness=brightness_value,
+            garment_spacing=spacing_value,
+            size_main=size_main_value,
+            size_accessory=size_accessory_value,
+            accessory_count=accessory_count_value,
+            object_spacing=object_spacing_value,
+            show_names=bool(show_names.get()),
+            font_name=selected_font.get(),
+            font_color=tuple(font_color_rgb),
+            use_watermark=bool(use_watermark.get()),
+            watermark_path=watermark_path_var.get(),
+            watermark_position=watermark_position.get(),
+            output_format=format_combo.get() if format_combo is not None else "PNG",
+        )
+
+    def check_category_images(self, category_images):
+        for category in ("maglie", "pantaloni", "sfondi"):
+            if not category_images.get(category):
+                raise OutfitGenerationError(f"La cartella '{category}' non è selezionata o non contiene immagini.")
+
+    def resolve_font_name(self, font_name, rng):
+        if font_name == "Random":
+            available_font_names = [f for f in self.available_fonts if f != "Random"]
+            return rng.choice(available_font_names) if available_font_names else None
+        return font_name
+
+    def load_font(self, font_name, font_size):
+        key = (font_name, font_size)
+        if key in self._loaded_fonts:
+            return self._loaded_fonts[key]
+        font = None
+        if font_name and font_name in self.font_objects:
+            try:
+                font = ImageFont.truetype(self.font_objects[font_name], font_size)
+            except Exception as e:
+                print(f"Warning: Errore nel caricamento del font {font_name}: {e}. Uso font predefinito.")
+        elif font_name:
+            print(f"Warning: Font '{font_name}' selezionato ma non trovato. Uso font predefinito.")
+        if font is None:
+            try:
+                font = ImageFont.load_default(font_size)
+            except TypeError: # Pillow < 10.1: font predefinito solo a dimensione fissa
+                font = ImageFont.load_default()
+        self._loaded_fonts[key] = font
+        return font
+
+    def render_batch(self, settings, quantity, output_folder, rng=None, progress_callback=None, layout_filter=None, seed=None):
+        # Genera e salva `quantity` outfit; restituisce i percorsi dei file scritti.
+        # layout_filter(scene) -> bool permette di scartare un layout prima di qualsiasi lavoro sui pixel.
+        # seed: seed del batch (altrimenti preso da `rng` o casuale). Ogni outfit usa un proprio seed derivato,
+        # salvato nei metadati del file insieme a quello del batch: render_seed lo riproduce da solo.
+        if not output_folder or not os.path.exists(output_folder):
+            raise OutfitGenerationError("Seleziona una cartella di salvataggio valida.")
+        if seed is None:
+            seed = rng.getrandbits(32) if rng is not None else self.new_seed()
+        rng = random.Random(seed)
+        print(f"DEBUG: Seed del batch: {seed}")
+
+        # Scansione unica delle cartelle tramite il catalogo, poi validazione sui risultati
+        category_images = self.load_category_images()
+        self.check_category_images(category_images)
+
+        # Il font "Random" viene scelto una volta per tutto il batch
+        if settings.show_names and settings.font_name == "Random":
+            settings = replace(settings, font_name=self.resolve_font_name(settings.font_name, rng))
+
+        output_format = settings.output_format.lower()
+        output_paths = []
+        # Un solo frame per tutto il batch; per JPG si compone direttamente in RGB (niente convert per file).
+        # Con il compositore NumPy i frame RGBA sono i suoi, miscelati sul posto
+        compositor = self.get_numpy_compositor()
+        frame_pool = FramePool(compositor.new_frame if compositor is not None else None)
+        frame_mode = "RGB" if output_format == "jpg" else "RGBA"
+        for i in range(quantity):
+            # Ogni tentativo ha il suo seed: viene registrato quello del layout accettato
+            outfit_seed = rng.getrandbits(32)
+            scene = self.solve_layout(settings, random.Random(outfit_seed), category_images)
+            if layout_filter is not None:
+                attempts = 1
+                while not layout_filter(scene) and attempts < self.MAX_LAYOUT_ATTEMPTS:
+                    outfit_seed = rng.getrandbits(32)
+                    scene = self.solve_layout(settings, random.Random(outfit_seed), category_images)
+                    attempts += 1
+            metadata = {"seed": outfit_seed, "batch_seed": seed, "font": settings.font_name if settings.show_names else None,
+                        "size": [scene.width, scene.height]}
+
+            # Formato principale + eventuali altri formati dallo stesso layout (stesse scelte, nessun nuovo sorteggio)
+            sizes = [(scene.width, scene.height)] + [tuple(size) for size in settings.export_sizes]
+            # I formati da stampa (4K e oltre) non passano dal frame intero: vengono scritti a strisce
+            tiled_sizes = [size for size in sizes if size[0] * size[1] >= self.TILED_RENDER_PIXELS]
+            variants = dict(self.render_variants(scene, [size for size in sizes if size not in tiled_sizes],
+                                                 check_contrast=settings.check_contrast,
+                                                 frame_pool=frame_pool, frame_mode=frame_mode))
+            for variant_width, variant_height in sizes:
+                canvas = variants.get((variant_width, variant_height))
+                if (variant_width, variant_height) == sizes[0]:
+                    base_filename = f"outfit_{i+1}.{output_format}"
+                else:
+                    base_filename = f"outfit_{i+1}_{variant_width}x{variant_height}.{output_format}"
+                unique_filename = self.get_unique_filename(output_folder, base_filename)
+                output_path = os.path.join(output_folder, unique_filename)
+                if canvas is None:
+                    variant = scene if (variant_width, variant_height) == sizes[0] else self.scale_scene(scene, variant_width, variant_height)
+                    self.render_tiled(variant, output_path, metadata=metadata)
+                else:
+                    self.save_output(canvas, output_path, metadata)
+                output_paths.append(output_path)
+            if progress_callback:
+                progress_callback(i + 1, quantity)
+
+        self.print_cache_stats()
+        return output_paths
+
+    def render_outfit(self, settings, rng, category_images=None):
+        """Renderizza un outfit con i parametri di `settings` e restituisce l'Image RGBA.
+
+        Tutta la casualita' passa da `rng` (random.Random o compatibile). Non usa widget ne'
+        messagebox: gli errori di configurazione sollevano OutfitGenerationError.
+        """
+        return self.composite_settings(self.solve_layout(settings, rng, category_images), settings)
+
+    def composite_settings(self, scene, settings):
+        if settings.draft_factor > 1:
+            return self.composite_draft(scene, settings.draft_factor, check_contrast=settings.check_contrast)
+        return self.composite_scene(scene, check_contrast=settings.check_contrast)
+
+    def render_seed(self, settings, seed, category_images=None, layout_size=None):
+        """Ri-renderizza l'outfit con seed `seed` (letto con read_outfit_seed o dal log dell'anteprima).
+
+        Le scelte casuali dipendono dalla risoluzione del layout: layout_size e' la risoluzione
+        registrata con il seed (metadati "size"). Il layout viene risolto sempre a quella e poi
+        portato a settings.width x settings.height con scale_scene, quindi con le stesse impostazioni
+        e le stesse cartelle la composizione e' la stessa anche a un'altra risoluzione o formato.
+        Per un file di un batch con font "Random" va passato come font_name il font dei metadati.
+        """
+        target_size = (settings.width, settings.height)
+        layout_settings = settings if layout_size is None else replace(settings, width=layout_size[0], height=layout_size[1])
+        scene = self.solve_layout(layout_settings, random.Random(seed), category_images)
+        if (scene.width, scene.height) != target_size:
+            scene = self.scale_scene(scene, *target_size)
+        return self.composite_settings(scene, settings)
+
+    def new_seed(self):
+        return random.SystemRandom().getrandbits(32)
+
+    def save_output(self, canvas, output_path, metadata=None):
+        # I seed finiscono nel file stesso: testo PNG o commento JPG, letti da read_outfit_seed
+        text = json.dumps(metadata) if metadata else None
+        if output_path.lower().endswith((".jpg", ".jpeg")):
+            canvas.save(output_path, quality=95, comment=text or "")
+        else:
+            pnginfo = None
+            if text:
+                pnginfo = PngImagePlugin.PngInfo()
+                pnginfo.add_text(self.SEED_METADATA_KEY, text)
+            canvas.save(output_path, pnginfo=pnginfo)
+
+    def read_outfit_seed(self, path):
+        # Metadati scritti da save_output/render_tiled ({"seed", "batch_seed", "font", "size"}), None se assenti
+        with Image.open(path) as img:
+            text = img.info.get(self.SEED_METADATA_KEY) or img.info.get("comment")
+        if isinstance(text, bytes):
+            text = text.decode("utf-8", "replace")
+        try:
+            metadata = json.loads(text) if text else None
+        except ValueError:
+            return None
+        return metadata if isinstance(metadata, dict) and "seed" in metadata else None
+
+    def draft_scene(self, scene, factor):
+        """Riduce di `factor` (2 = meta', 4 = un quarto) una scena gia' risolta, senza cambiarne il layout.
+
+        Box, font e sfocatura vengono scalati direttamente: la bozza e' la stessa composizione del
+        render finale, quindi con lo stesso seed si puo' passare alla versione definitiva.
+        """
+        def scaled(box):
+            return Box(int(box.x / factor), int(box.y / factor), max(1, int(box.w / factor)), max(1, int(box.h / factor)))
+
+        background = scene.background
+        draft = Scene(max(1, scene.width // factor), max(1, scene.height // factor),
+                      Background(background.kind, background.color, background.path, background.blur / factor, background.brightness),
+                      font=scene.font, font_size=max(1, int(round(scene.font_size / factor))), font_color=scene.font_color)
+        for layer in scene.layers:
+            box = scaled(layer.box)
+            draft.layers.append(Layer(layer.role, layer.category, layer.path, layer.name, box.w, box.h, box))
+        for label in scene.labels:
+            draft.labels.append(Label(label.layer, label.text, scaled(label.box)))
+        if scene.watermark:
+            box = scaled(scene.watermark.box)
+            draft.watermark = Watermark(scene.watermark.path, box.w, box.h, box)
+        return draft
+
+    def scale_scene(self, scene, width, height):
+        """Porta una scena gia' risolta a width x height senza rifare le scelte casuali (render_seed).
+
+        Con le stesse proporzioni posizioni, font e sfocatura vengono moltiplicati per lo stesso
+        fattore e le dimensioni degli sprite ricalcolate senza pixel, come farebbe solve_layout a
+        quella risoluzione; con proporzioni diverse la scena viene adattata da refit_scene.
+        """
+        if width * scene.height != height * scene.width:
+            return self.refit_scene(scene, width, height)
+        k = width / scene.width
+
+        def scaled_item(box, image_data, max_w, max_h):
+            max_w, max_h = max(1, int(max_w * k)), max(1, int(max_h * k))
+            sprite_w, sprite_h = self.sprite_size(image_data, max_w, max_h)
+            return max_w, max_h, Box(int(round(box.x * k)), int(round(box.y * k)), sprite_w, sprite_h)
+
+        background = scene.background
+        scaled = Scene(width, height, Background(background.kind, background.color, background.path, background.blur * k, background.brightness),
+                       font=scene.font, font_size=max(1, int(round(scene.font_size * k))), font_color=scene.font_color)
+        for layer in scene.layers:
+            max_w, max_h, box = scaled_item(layer.box, self.catalog.get(layer.path) or layer.path, layer.max_w, layer.max_h)
+            scaled.layers.append(Layer(layer.role, layer.category, layer.path, layer.name, max_w, max_h, box))
+        for label in scene.labels:
+            box = label.box
+            scaled.labels.append(Label(label.layer, label.text, Box(int(round(box.x * k)), int(round(box.y * k)), box.w * k, scaled.font_size)))
+        if scene.watermark:
+            watermark = scene.watermark
+            scaled.watermark = Watermark(watermark.path, *scaled_item(watermark.box, watermark.path, watermark.max_w, watermark.max_h))
+        return scaled
+
+    def composite_draft(self, scene, factor, check_contrast=False):
+        return self.composite_scene(self.draft_scene(scene, factor), check_contrast=check_contrast, resample=self.DRAFT_RESAMPLE)
+
+    def solve_layout(self, settings, rng, category_images=None):
+        """Fase 1: sceglie asset e posizioni usando solo le dimensioni (catalogo/header), senza pixel.
+
+        Restituisce una Scene (outfit_model): sfondo, livelli con box e percorso dell'asset,
+        etichette con posizione e rettangolo del watermark. composite_scene la rasterizza.
+        """
+        if category_images is None:
+            category_images = self.load_category_images()
+        self.check_category_images(category_images)
+
+        frame = self.frame(settings.width, settings.height)
+        scene = Scene(frame.width, frame.height, font_size=max(1, frame.px(self.FONT_SIZE)), font_color=tuple(settings.font_color))
+        font = None
+        if settings.show_names:
+            scene.font = self.resolve_font_name(settings.font_name, rng)
+            font = self.load_font(scene.font, scene.font_size)
+
+        # Sfondo: tinta unita o foto, gli effetti vengono applicati in composizione
+        if rng.random() < 0.6:
+            scene.background = Background("solid", color=tuple(rng.choice(self.background_palette)), brightness=settings.brightness)
+        else:
+            background_data = rng.choice(category_images["sfondi"])
+            scene.background = Background("photo", path=background_data[0], blur=settings.blur, brightness=settings.brightness)
+
+        occupied_areas = self.occupancy_grid(frame) # Box of placed items and text
+
+        # Parametri di ridimensionamento
+        size_main_factor = settings.size_main / 100
+        size_accessory_factor = settings.size_accessory / 100
+        # Distanze in pixel del formato di riferimento, scalate sul frame
+        object_spacing = frame.px(settings.object_spacing * 2)
+        # spacing is for vertical distance between shirt and pants
+        spacing = frame.px(settings.garment_spacing * 3)
+        max_accessories = max(2, settings.accessory_count)
+
+        # Maglia e pantaloni: solo dimensioni, i pixel si caricano in composizione
+        main_max_size = self.main_item_max_size(size_main_factor, frame)
+        shirt_data = rng.choice(category_images["maglie"])
+        shirt_w, shirt_h = self.sprite_size(shirt_data, *main_max_size)
+        pants_data = rng.choice(category_images["pantaloni"])
+        pants_w, pants_h = self.sprite_size(pants_data, *main_max_size)
+
+        # --- Main Garment Placement Strategy ---
+        # Randomly chooses 'center', 'left', or 'right' for the main garment block.
+        placement_options = ['center', 'left', 'right']
+        chosen_placement = rng.choice(placement_options)
+
+        # Usable area for content, excluding accessory margins.
+        margin = frame.margin
+        content_width = frame.content_width
+        content_height = frame.content_height # For vertical centering of garment block
+
+        # X-coordinate calculation based on chosen placement
+        offset_amount = content_width // 7 # Amount to shift for 'left'/'right' placements
+        base_center_x_shirt = margin + (content_width - shirt_w) // 2
+        base_center_x_pants = margin + (content_width - pants_w) // 2
+        if chosen_placement == 'center':
+            shirt_x, pants_x = base_center_x_shirt, base_center_x_pants
+        elif chosen_placement == 'left':
+            shirt_x, pants_x = base_center_x_shirt - offset_amount, base_center_x_pants - offset_amount
+        else: # 'right'
+            shirt_x, pants_x = base_center_x_shirt + offset_amount, base_center_x_pants + offset_amount
+
+        # Ensure x positions are firmly within accessory margins and don't push content outside visual bounds.
+        shirt_x = max(margin, min(shirt_x, frame.width - margin - shirt_w))
+        pants_x = max(margin, min(pants_x, frame.width - margin - pants_w))
+
+        total_garment_height = shirt_h + pants_h + spacing
+
+        # Calculate initial Y to center the block within the content height, respecting both margins
+        shirt_y = margin + (content_height - total_garment_height) // 2
+        shirt_y = max(margin, shirt_y)
+        if shirt_y + total_garment_height > frame.height - margin:
+            shirt_y = frame.height - margin - total_garment_height
+            # Re-check against top margin in case of very large items
+            shirt_y = max(margin, shirt_y)
+
+        pants_y = shirt_y + shirt_h + spacing
+
+        shirt_box = Box(shirt_x, shirt_y, shirt_w, shirt_h)
+        pants_box = Box(pants_x, pants_y, pants_w, pants_h)
+        for item_data, item_box, role, category in ((shirt_data, shirt_box, "shirt", "maglie"), (pants_data, pants_box, "pants", "pantaloni")):
+            self.add_layer(scene, occupied_areas, role, category, item_data, main_max_size, item_box, font, frame)
+
+        # ---- Accessory Placement Setup ----
+        garment_block_x_start = min(shirt_box.x, pants_box.x)
+        garment_block_x_end = max(shirt_box.right, pants_box.right)
+        accessory_zones = self.build_accessory_zones(chosen_placement, garment_block_x_start, garment_block_x_end, object_spacing, frame)
+        free_space = {} # zone.id -> FreeRectangles, creati da place_accessory
+
+        # --- Accessory Selection and Prioritization ---
+        available_accessories_with_images = [cat for cat in self.accessory_rules if category_images.get(cat)] # Check if cat images are loaded
+
+        # Sorts by priority (lower number = higher priority), then shuffles within each priority group.
+        sorted_accessories = sorted(
+            available_accessories_with_images,
+            key=lambda cat: (self.accessory_rules[cat].priority, rng.random())
+        )
+
+        num_to_select = min(max_accessories, len(sorted_accessories))
+        selected_accessories = sorted_accessories[:num_to_select] # Top N accessories are selected, attempted in priority order.
+
+        for accessory in selected_accessories:
+            item_data = rng.choice(category_images[accessory])
+            max_size = self.accessory_max_size(accessory, size_main_factor, size_accessory_factor, frame)
+            item_w, item_h = self.sprite_size(item_data, *max_size)
+
+            # place_accessory salta subito le zone senza un rettangolo libero abbastanza grande
+            position = self.place_accessory(accessory, item_w, item_h, shirt_box, pants_box, accessory_zones, free_space, occupied_areas, object_spacing, spacing, rng, frame)
+            if position is None:
+                # L'asset estratto non entra in nessuna zona: se possibile uno della stessa categoria con proporzioni adatte
+                alternative = self.fitting_alternative(accessory, item_data, category_images[accessory], max_size,
+                                                       accessory_zones, free_space, occupied_areas, object_spacing, rng, frame)
+                if alternative is not None:
+                    item_data, (item_w, item_h) = alternative
+                    position = self.place_accessory(accessory, item_w, item_h, shirt_box, pants_box, accessory_zones, free_space, occupied_areas, object_spacing, spacing, rng, frame)
+            if position is None and "alpha_mask" in self.accessory_rules[accessory].fallback:
+                # Nessun rettangolo libero: si cerca tra le forme reali (angoli vuoti di occhiali, scarpe, auto...)
+                position = self.place_by_mask(item_data, item_w, item_h, occupied_areas, object_spacing, rng, frame)
+            if position is None:
+                continue
+            self.add_layer(scene, occupied_areas, "accessory", accessory, item_data, max_size, Box(position[0], position[1], item_w, item_h), font, frame)
+
+        # Posizionamento watermark: dopo tutti gli oggetti e i loro nomi, controllando le sovrapposizioni
+        if settings.use_watermark and settings.watermark_path:
+            scene.watermark = self.layout_watermark(settings, occupied_areas, frame)
+
+        return scene
+
+    def refit_scene(self, scene, width, height):
+        """Adatta una scena gia' risolta a un altro formato senza rifare le scelte casuali.
+
+        Il blocco di capi, accessori e nomi viene scalato in modo uniforme per stare nell'area utile
+        del nuovo frame e centrato; il watermark resta ancorato al bordo (sopra/sotto) di partenza.
+        Le dimensioni degli sprite vengono ricalcolate come in solve_layout, senza pixel.
+        """
+        frame = self.frame(width, height)
+        source_frame = self.frame(scene.width, scene.height)
+        boxes = [layer.box for layer in scene.layers] + [label.box for label in scene.labels]
+        left = min(box.x for box in boxes)
+        top = min(box.y for box in boxes)
+        content_w = max(box.right for box in boxes) - left
+        content_h = max(box.bottom for box in boxes) - top
+        # Mai piu' grande di quanto il cambio di risoluzione giustifichi (niente sprite ingranditi a 1080)
+        size_scale = frame.scale / source_frame.scale
+        k = min(frame.content_width / content_w, frame.content_height / content_h, size_scale)
+        offset_x = (width - content_w * k) / 2 - left * k
+        offset_y = (height - content_h * k) / 2 - top * k
+
+        def refit_box(box, image_data, scale):
+            max_w, max_h = max(1, int(box.w * scale)), max(1, int(box.h * scale))
+            sprite_w, sprite_h = self.sprite_size(image_data, max_w, max_h)
+            # Stesso centro dell'originale, nel nuovo frame
+            x = int(round(offset_x + (box.x + box.w / 2) * k - sprite_w / 2))
+            y = int(round(offset_y + (box.y + box.h / 2) * k - sprite_h / 2))
+            return max_w, max_h, Box(x, y, sprite_w, sprite_h)
+
+        variant = Scene(width, height, scene.background, font=scene.font,
+                        font_size=max(1, int(round(scene.font_size * k))), font_color=scene.font_color)
+        occupied_areas = self.occupancy_grid(frame)
+        for layer in scene.layers:
+            max_w, max_h, box = refit_box(layer.box, self.catalog.get(layer.path) or layer.path, k)
+            variant.layers.append(Layer(layer.role, layer.category, layer.path, layer.name, max_w, max_h, box))
+            occupied_areas.insert(box)
+        if scene.labels:
+            font = self.load_font(variant.font, variant.font_size)
+            for layer_index in sorted({label.layer for label in scene.labels}):
+                self.layout_item_name(variant, layer_index, font, occupied_areas, frame)
+
+        watermark = scene.watermark
+        if watermark:
+            max_w, max_h = max(1, int(watermark.max_w * size_scale)), max(1, int(watermark.max_h * size_scale))
+            wm_width, wm_height = self.sprite_size(watermark.path, max_w, max_h)
+            if watermark.box.y < scene.height / 2:
+                wm_y = frame.px(self.WATERMARK_MARGIN_TOP)
+            else:
+                wm_y = height - wm_height - frame.px(self.WATERMARK_MARGIN_BOTTOM_TIKTOK)
+            watermark_box = Box((width - wm_width) // 2, wm_y, wm_width, wm_height)
+            if occupied_areas.overlaps(watermark_box):
+                print(f"Warning: Watermark non inserito nel formato {width}x{height}: si sovrapporrebbe agli oggetti.")
+            else:
+                variant.watermark = Watermark(watermark.path, max_w, max_h, watermark_box)
+        return variant
+
+    def render_variants(self, scene, sizes, check_contrast=False, frame_pool=None, frame_mode="RGBA"):
+        """Rasterizza la stessa scena in piu' formati: [((w, h), Image), ...] nell'ordine di `sizes`.
+
+        Gli sprite vengono decodificati una volta per la scena originale; i formati piu' piccoli
+        li ottengono ridimensionando quelli gia' in memoria invece di rileggere i file.
+        I formati con le stesse proporzioni mantengono la composizione (scale_scene), gli altri
+        vengono adattati da refit_scene.
+        """
+        base_sprites = [self.load_sprite(self.catalog.get(layer.path) or layer.path, layer.max_w, layer.max_h)
+                        for layer in scene.layers]
+        if scene.watermark:
+            base_sprites.append(self.load_sprite(scene.watermark.path, scene.watermark.max_w, scene.watermark.max_h))
+
+        results = []
+        for width, height in sizes:
+            variant = scene if (width, height) == (scene.width, scene.height) else self.scale_scene(scene, width, height)
+            if variant is not scene:
+                placed = [(self.catalog.get(layer.path) or layer.path, layer) for layer in variant.layers]
+                if variant.watermark:
+                    placed.append((variant.watermark.path, variant.watermark))
+                for base_sprite, (image_data, placed_item) in zip(base_sprites, placed):
+                    box = placed_item.box
+                    if box.w <= base_sprite.width and box.h <= base_sprite.height:
+                        key, _ = self.sprite_key(image_data, placed_item.max_w, placed_item.max_h)
+                        self.sprite_cache.get_or_load(key, lambda base_sprite=base_sprite, box=box: base_sprite.resize(
+                            (box.w, box.h), Image.Resampling.LANCZOS))
+            canvas = frame_pool.acquire(frame_mode, (width, height)) if frame_pool else None
+            results.append(((width, height), self.composite_scene(variant, check_contrast=check_contrast, canvas=canvas)))
+        return results
+
+    def occupancy_grid(self, frame):
+        return OccupancyGrid(frame.width, frame.height, frame.px(self.OCCUPANCY_CELL_SIZE), max(1, frame.px(self.COLLISION_CELL)))
+
+    def collision_mask(self, image_data, width, height, cell):
+        # Maschera di occupazione dello sprite width x height a celle di `cell` pixel, dal suo canale alpha.
+        # L'alpha viene letto una volta per asset (dalla derivata, gia' ritagliata) e ridotto: le maschere
+        # per ogni dimensione si ricavano da quello, senza ridecodificare.
+        path, mtime = self.asset_file(image_data, render=True)
+        columns, rows = max(1, math.ceil(width / cell)), max(1, math.ceil(height / cell))
+        return self._collision_masks.get_or_load((path, mtime, columns, rows), lambda: alpha_mask_rows(
+            self.sprite_cache.get_or_load((path, mtime, "alpha"), lambda: self.alpha_sample(path)), columns, rows, threshold=1))
+
+    def alpha_sample(self, path):
+        alpha = open_oriented(path).getchannel("A")
+        # Soglia prima della riduzione: i dettagli sottili restano (media > 0) invece di sparire
+        sample = alpha.point(lambda a: 255 if a >= ALPHA_THRESHOLD else 0)
+        sample.thumbnail((self.ALPHA_SAMPLE_SIZE, self.ALPHA_SAMPLE_SIZE), Image.Resampling.BOX)
+        return sample
+
+    def place_by_mask(self, item_data, item_w, item_h, occupied_areas, object_spacing, rng, frame):
+        # Posizione casuale tra quelle libere secondo le maschere alpha, in tutta l'area utile; None se non c'e' posto
+        coverage = occupied_areas.coverage()
+        mask = self.collision_mask(item_data, item_w, item_h, coverage.cell)
+        zone = self.content_zone(frame)
+        positions = coverage.free_positions(mask, math.ceil(object_spacing / coverage.cell),
+                                            (zone.x_start, zone.y_start, zone.x_end, zone.y_end), item_w, item_h)
+        return rng.choice(positions) if positions else None
+
+    def add_layer(self, scene, occupied_areas, role, category, item_data, max_size, item_box, font, frame):
+        scene.layers.append(Layer(role, category, item_data[0], item_data[1], max_size[0], max_size[1], item_box))
+        occupied_areas.insert(item_box, lambda: self.collision_mask(item_data, item_box.w, item_box.h, occupied_areas.mask_cell))
+        if font:
+            self.layout_item_name(scene, len(scene.layers) - 1, font, occupied_areas, frame)
+
+    def composite_scene(self, scene, check_contrast=False, canvas=None, resample=Image.Resampling.LANCZOS):
+        """Fase 2: rasterizza una scena prodotta da solve_layout (anche salvata e ricaricata).
+
+        canvas: frame gia' allocato (RGBA o RGB, delle dimensioni della scena) da riusare, per
+        esempio da un FramePool; viene sovrascritto interamente.
+        resample: filtro per sfondo e sprite (le bozze usano DRAFT_RESAMPLE).
+        """
+        width, height = scene.width, scene.height
+        background = scene.background
+        if background.kind == "solid":
+            background_img = self.solid_background(background.color, width, height, background.brightness)
+        else:
+            background_data = self.catalog.get(background.path) or background.path
+            background_img = self.get_processed_background(background_data, width, height, background.blur, background.brightness, resample)
+
+        # Tutti i livelli (capi, accessori, watermark) nell'ordine di disegno
+        layer_images = []
+        for layer in scene.layers:
+            # Stesso record del catalogo usato in fase di layout: stessa chiave di cache e stesso sprite grezzo
+            item_data = self.catalog.get(layer.path) or layer.path
+            layer_images.append((self.load_sprite(item_data, layer.max_w, layer.max_h, resample), (layer.box.x, layer.box.y)))
+        watermark = scene.watermark
+        if watermark:
+            watermark_img = self.load_sprite(watermark.path, watermark.max_w, watermark.max_h, resample)
+            layer_images.append((watermark_img, (watermark.box.x, watermark.box.y)))
+
+        compositor = self.get_numpy_compositor()
+        if compositor is not None:
+            canvas = compositor.composite(background_img, layer_images, out=canvas)
+        else:
+            if canvas is None:
+                canvas = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+            # Lo sfondo e' opaco e copre tutto il frame: nessun residuo dell'outfit precedente
+            canvas.paste(background_img, (0, 0))
+            for item_img, position in layer_images:
+                canvas.paste(item_img, position, item_img)
+
+        # I nomi si disegnano per ultimi, sopra tutti i livelli, cosi' restano leggibili
+        font_color = tuple(scene.font_color)
+        if scene.labels:
+            draw = ImageDraw.Draw(canvas)
+            font = self.load_font(scene.font, scene.font_size)
+            for label in scene.labels:
+                draw.text((label.box.x, label.box.y), label.text, font=font, fill=font_color)
+
+        if check_contrast:
+            for layer, (item_img, _) in zip(scene.layers, layer_images):
+                self.warn_low_contrast(canvas, item_img, layer.box, self.layer_label(layer))
+            for label in scene.labels:
+                self.warn_low_text_contrast(canvas, label, font_color, self.layer_label(scene.layers[label.layer]))
+
+        return canvas
+
+    def render_tiled(self, scene, output_path, strip_height=None, metadata=None):
+        """Rasterizza la scena a strisce orizzontali e la scrive direttamente in `output_path`.
+
+        Per ogni striscia si calcolano solo lo sfondo corrispondente (con la sovrapposizione che
+        serve alla sfocatura) e i livelli che la intersecano, quindi la memoria dipende dall'altezza
+        della striscia e non dal formato. I PNG vengono scritti striscia per striscia; per JPG Pillow
+        non ha un encoder a righe e le strisce vengono raccolte in un unico frame RGB.
+        """
+        strip_height = strip_height or self.TILED_STRIP_HEIGHT
+        width, height = scene.width, scene.height
+        background = scene.background
+        if background.kind == "solid":
+            source, fill = None, self.adjusted_background_color(background.color, background.brightness)
+        else:
+            background_data = self.catalog.get(background.path) or background.path
+            source = self.open_background_source(self.asset_file(background_data)[0], width, height)
+            # La GaussianBlur di Pillow (tre box blur) legge fino a circa 3 raggi oltre ogni riga
+            overlap = int(math.ceil(background.blur * 3)) + 2 if background.blur > 0 else 0
+
+        layer_images = []
+        for layer in scene.layers:
+            item_data = self.catalog.get(layer.path) or layer.path
+            layer_images.append((self.load_sprite(item_data, layer.max_w, layer.max_h), layer.box))
+        if scene.watermark:
+            watermark = scene.watermark
+            layer_images.append((self.load_sprite(watermark.path, watermark.max_w, watermark.max_h), watermark.box))
+        font = self.load_font(scene.font, scene.font_size) if scene.labels else None
+        font_color = tuple(scene.font_color)
+
+        is_png = not output_path.lower().endswith((".jpg", ".jpeg"))
+        text = {self.SEED_METADATA_KEY: json.dumps(metadata)} if metadata else None
+        writer = StreamingPNGWriter(output_path, width, height, "RGBA", text=text) if is_png else None
+        frame = None if is_png else Image.new("RGB", (width, height))
+        try:
+            for top in range(0, height, strip_height):
+                bottom = min(height, top + strip_height)
+                if source is None:
+                    strip = Image.new("RGBA", (width, bottom - top), fill)
+                else:
+                    strip = self.background_strip(source, width, height, top, bottom, background.blur, background.brightness, overlap).convert("RGBA")
+                for item_img, box in layer_images:
+                    if box.y < bottom and box.y + item_img.height > top:
+                        strip.paste(item_img, (box.x, box.y - top), item_img)
+                if font:
+                    draw = ImageDraw.Draw(strip)
+                    for label in scene.labels:
+                        # Margine di un'altezza di riga: i discendenti possono uscire dal box del nome
+                        if label.box.y < bottom and label.box.bottom + label.box.h > top:
+                            draw.text((label.box.x, label.box.y - top), label.text, font=font, fill=font_color)
+                if writer:
+                    writer.write_strip(strip)
+                else:
+                    frame.paste(strip.convert("RGB"), (0, top))
+        except Exception:
+            if writer:
+                writer.abort()
+            raise
+        if writer:
+            return writer.close()
+        frame.save(output_path, quality=95, comment=text[self.SEED_METADATA_KEY] if text else "")
+        return output_path
+
+    def background_strip(self, source, width, height, top, bottom, blur_value, brightness_value, overlap):
+        # Righe top..bottom dello sfondo elaborato: si ricampiona solo la fascia della foto che serve,
+        # allargata di `overlap` righe perche' la sfocatura ai bordi della striscia veda i pixel vicini
+        padded_top, padded_bottom = max(0, top - overlap), min(height, bottom + overlap)
+        if source.size == (width, height):
+            region = source.crop((0, padded_top, width, padded_bottom))
+        else:
+            scale_y = source.height / height
+            region = source.resize((width, padded_bottom - padded_top), Image.Resampling.LANCZOS,
+                                   box=(0, padded_top * scale_y, source.width, padded_bottom * scale_y),
+                                   reducing_gap=self.BACKGROUND_REDUCING_GAP)
+        region = self.apply_background_effects(region, blur_value, brightness_value)
+        return region.crop((0, top - padded_top, width, bottom - padded_top))
+
+    def get_numpy_compositor(self):
+        # None se il compositore NumPy e' disattivato o numpy non e' installato (si usa Image.paste)
+        if not self.use_numpy_compositor:
+            return None
+        if self._numpy_compositor is None:
+            if not numpy_available():
+                print("Warning: numpy non e' installato, uso Image.paste per la composizione.")
+                self.use_numpy_compositor = False
+                return None
+            self._numpy_compositor = NumpyCompositor(self.NUMPY_SPRITE_CACHE_BYTES)
+        return self._numpy_compositor
+
+    def layer_label(self, layer):
+        if layer.role == "accessory":
+            return f"ACCESSORY '{layer.name}'"
+        return "SHIRT" if layer.role == "shirt" else "PANTS"
+
+    def build_accessory_zones(self, chosen_placement, garment_block_x_start, garment_block_x_end, object_spacing, frame):
+        # Defines zones (left/right of garments) based on main garment placement.
+        # `object_spacing` is used to ensure accessories don't touch the garment block directly.
+        accessory_zones = []
+        zone_y_start = frame.margin
+        zone_y_end = frame.height - frame.margin
+
+        left_x = (frame.margin, garment_block_x_start - object_spacing)
+        right_x = (garment_block_x_end + object_spacing, frame.width - frame.margin)
+        if chosen_placement == 'center':
+            accessory_zones.append(Zone("left_of_center", *left_x, zone_y_start, zone_y_end, "left"))
+            accessory_zones.append(Zone("right_of_center", *right_x, zone_y_start, zone_y_end, "right"))
+        elif chosen_placement == 'left':
+            # Primary zone is to the right of left-placed garments
+            accessory_zones.append(Zone("right_of_left_garments", *right_x, zone_y_start, zone_y_end, "right"))
+        elif chosen_placement == 'right':
+            # Primary zone is to the left of right-placed garments
+            accessory_zones.append(Zone("left_of_right_garments", *left_x, zone_y_start, zone_y_end, "left"))
+
+        # Filter out zones that are too narrow or short.
+        min_zone_size = frame.px(50)
+        accessory_zones = [z for z in accessory_zones if z.width > min_zone_size and z.height > min_zone_size]
+
+        # Fallback: If specific zones are invalid (e.g., garments too wide), use the whole content area.
+        if not accessory_zones:
+            accessory_zones.append(self.content_zone(frame))
+        return accessory_zones
+
+    def content_zone(self, frame):
+        return Zone("full_content_area_fallback", frame.margin, frame.width - frame.margin, frame.margin, frame.height - frame.margin)
+
+    def place_accessory(self, accessory, item_w, item_h, shirt_box, pants_box, accessory_zones, free_space, occupied_areas, object_spacing, spacing, rng, frame):
+        # Restituisce (x, y) per un accessorio item_w x item_h secondo la sua regola, oppure None se non c'e' posto
+        rule, anchor = self._placement_plans[accessory]
+        placement = {"shirt": shirt_box, "pants": pants_box, "zones": accessory_zones,
+                     "object_spacing": object_spacing, "spacing": spacing, "frame": frame}
+
+        # --- Zone-based Placement ---
+        # Ogni zona conosce i suoi rettangoli liberi: si sceglie solo tra posizioni che entrano di sicuro,
+        # la casualita' decide quale posizione valida usare (niente tentativi scartati)
+        jitter = frame.px(15)
+
+        shuffled_zones = []
+        for fallback in rule.fallback:
+            if fallback == "zones":
+                # Shuffle zones to try different areas if the first choice is crowded
+                shuffled_zones += rng.sample(accessory_zones, len(accessory_zones)) if accessory_zones else []
+            elif fallback == "content_area":
+                # Tutta l'area utile, compreso lo spazio libero sopra, sotto e accanto ai capi
+                content_zone = self.content_zone(frame)
+                if all(zone.id != content_zone.id for zone in shuffled_zones):
+                    shuffled_zones.append(content_zone)
+
+        for current_zone in shuffled_zones:
+            slots = self.zone_free_space(current_zone, free_space, occupied_areas, object_spacing).slots(item_w, item_h)
+            if not slots:
+                continue
+
+            if anchor is None: # "free": wallet, profumi, etc. - more flexible
+                # Posizione uniforme tra quelle libere: ogni slot pesa quanto le posizioni che offre
+                slot = rng.choices(slots, weights=[(s[2] - s[0] + 1) * (s[3] - s[1] + 1) for s in slots])[0]
+                return rng.randint(slot[0], slot[2]), rng.randint(slot[1], slot[3])
+            current_x, current_y = anchor(item_w, item_h, current_zone, placement)
+
+            # Punto preferito con un po' di jitter, poi la posizione valida piu' vicina
+            target_x = current_x + rng.randint(-jitter, jitter)
+            target_y = current_y + rng.randint(-jitter, jitter)
+            candidates = [(max(slot[0], min(target_x, slot[2])), max(slot[1], min(target_y, slot[3]))) for slot in slots]
+            return min(candidates, key=lambda point: (point[0] - target_x) ** 2 + (point[1] - target_y) ** 2)
+        return None
+
+    def zone_free_space(self, zone, free_space, occupied_areas, object_spacing):
+        # Spazio libero della zona, aggiornato con le aree occupate man mano che si piazzano oggetti e nomi
+        zone_space = free_space.get(zone.id)
+        if zone_space is None:
+            zone_space = free_space[zone.id] = FreeRectangles(zone.x_start, zone.y_start, zone.x_end, zone.y_end, object_spacing)
+        zone_space.sync(occupied_areas)
+        return zone_space
+
+    def fits_free_space(self, accessory, item_w, item_h, accessory_zones, free_space, occupied_areas, object_spacing, frame):
+        # Controllo di fattibilita' senza casualita': qualche zona della regola ha un rettangolo libero abbastanza grande?
+        rule = self.accessory_rules[accessory]
+        zones = list(accessory_zones) if "zones" in rule.fallback else []
+        if "content_area" in rule.fallback:
+            # L'area utile contiene tutte le zone: se li' non c'e' posto non c'e' da nessuna parte
+            zones = [self.content_zone(frame)]
+        return any(self.zone_free_space(zone, free_space, occupied_areas, object_spacing).slots(item_w, item_h) for zone in zones)
+
+    def fitting_alternative(self, accessory, item_data, candidates, max_size, accessory_zones, free_space, occupied_areas, object_spacing, rng, frame):
+        # Un altro asset della categoria che, ridimensionato a max_size, entra nello spazio libero.
+        # Solo dimensioni dal catalogo: nessuna immagine viene decodificata. None se nessuno entra.
+        fitting = []
+        tried_sizes = {}
+        for candidate in candidates:
+            if candidate is item_data:
+                continue
+            size = self.sprite_size(candidate, *max_size)
+            fits = tried_sizes.get(size)
+            if fits is None:
+                fits = tried_sizes[size] = self.fits_free_space(accessory, size[0], size[1], accessory_zones, free_space, occupied_areas, object_spacing, frame)
+            if fits:
+                fitting.append((candidate, size))
+        return rng.choice(fitting) if fitting else None
+
+    def anchor_gap(self, placement):
+        object_spacing, frame = placement["object_spacing"], placement["frame"]
+        return object_spacing // 4 if object_spacing > frame.px(10) else frame.px(5)
+
+    def anchor_above_shirt(self, item_w, item_h, zone, placement):
+        shirt = placement["shirt"]
+        return shirt.x + (shirt.w - item_w) // 2, shirt.y - item_h - self.anchor_gap(placement) # Place slightly above shirt
+
+    def anchor_waist(self, item_w, item_h, zone, placement):
+        shirt = placement["shirt"]
+        return shirt.x + (shirt.w - item_w) // 2, shirt.bottom - item_h // 2 + placement["spacing"] // 3 # Between shirt and pants like
+
+    def anchor_below_pants(self, item_w, item_h, zone, placement):
+        pants = placement["pants"]
+        return pants.x + (pants.w - item_w) // 2, pants.bottom + self.anchor_gap(placement)
+
+    def anchor_largest_zone(self, item_w, item_h, zone, placement):
+        # Centro della zona piu' grande (oggetti ingombranti come 'auto')
+        largest_zone = max(placement["zones"], key=lambda z: z.area) if placement["zones"] else zone
+        return largest_zone.x_start + (largest_zone.width - item_w) // 2, largest_zone.y_start + (largest_zone.height - item_h) // 2
+
+    def anchor_garment_edge(self, item_w, item_h, zone, placement):
+        # Sul lato della zona verso i capi, a un terzo dell'altezza della maglia
+        shirt, object_spacing = placement["shirt"], placement["object_spacing"]
+        if zone.target_side == "left":
+            x = zone.x_end - item_w - (object_spacing // 2)
+        elif zone.target_side == "right":
+            x = zone.x_start + (object_spacing // 2)
+        else:
+            x = zone.x_start + (zone.width - item_w) // 2
+        return x, shirt.y + shirt.h // 3
+
+    def layout_item_name(self, scene, layer_index, font, occupied_areas, frame):
+        # Nome centrato sotto l'oggetto, dentro i margini; l'area del testo diventa occupata
+        layer = scene.layers[layer_index]
+        item_name = layer.name
+        x, y, w, h = layer.box.to_record()
+        font_size = scene.font_size # font_size as proxy for text height
+        text_width = font.getlength(item_name)
+        text_x = x + (w - text_width) // 2
+        text_y = y + h + frame.px(5) # Small gap for text below item
+        text_x = max(frame.margin, min(text_x, frame.width - frame.margin - text_width))
+        text_y = max(frame.margin, min(text_y, frame.height - frame.margin - font_size))
+        label = Label(layer_index, item_name, Box(text_x, text_y, text_width, font_size))
+        scene.labels.append(label)
+        if text_width > 0:
+            occupied_areas.insert(label.box)
+
+    def warn_low_contrast(self, canvas, item_img, item_box, label):
+        x, y, w, h = item_box.to_record()
+        avg_item_color = self.get_average_color(item_img)
+        avg_bg_color = self.get_average_color(canvas, box=(x, y, x + w, y + h))
+        contrast = self.get_contrast_ratio(self.get_relative_luminance(avg_item_color), self.get_relative_luminance(avg_bg_color))
+        if contrast < self.MIN_CONTRAST_THRESHOLD:
+            print(f"Warning: Low contrast ({contrast:.2f}) for {label}. Item color: {avg_item_color}, Bg color: {avg_bg_color}")
+
+    def warn_low_text_contrast(self, canvas, text_label, font_color, label):
+        text_x, text_y, text_width, text_height = text_label.box.to_record()
+        if text_width <= 0:
+            return
+        avg_text_bg_color = self.get_average_color(canvas, box=(text_x, text_y, text_x + text_width, text_y + text_height))
+        text_contrast = self.get_contrast_ratio(self.get_relative_luminance(font_color), self.get_relative_luminance(avg_text_bg_color))
+        if text_contrast < self.MIN_TEXT_CONTRAST_THRESHOLD:
+            print(f"Warning: Low contrast ({text_contrast:.2f}) for {label} TEXT '{text_label.text}'. Text: {font_color}, Bg: {avg_text_bg_color}")
+
+    def layout_watermark(self, settings, occupied_areas, frame):
+        # Ridimensionato a max 25% della larghezza; None se non c'e' posto
+        max_wm_width = int(frame.width * 0.25)
+        wm_width, wm_height = self.sprite_size(settings.watermark_path, max_wm_width, frame.height)
+        if not wm_width or not wm_height:
+            return None
+
+        if settings.watermark_position == "Sopra":
+            wm_y = frame.px(self.WATERMARK_MARGIN_TOP)
+        else: # "Sotto"
+            wm_y = frame.height - wm_height - frame.px(self.WATERMARK_MARGIN_BOTTOM_TIKTOK)
+        wm_x = (frame.width - wm_width) // 2
+
+        # One-way check: the watermark is skipped if it would cover an item, and is not added to occupied_areas
+        watermark_box = Box(wm_x, wm_y, wm_width, wm_height)
+        if occupied_areas.overlaps(watermark_box):
+            print(f"Warning: Watermark placement at ({wm_x}, {wm_y}) would overlap with existing items. Skipping watermark.")
+            return None
+
+        return Watermark(settings.watermark_path, max_wm_width, frame.height, watermark_box)
+
     def generate_outfits(self, width_entry, height_entry, quantity_spinbox, output_entry, format_combo, show_names, use_watermark, watermark_path_var, watermark_position, selected_font, blur_slider, brightness_slider, spacing_slider, size_main_slider, size_accessory_slider, accessory_count_slider_obj, actual_object_spacing_slider_obj, font_color_rgb, root):
+        from tkinter import messagebox
         try:
-            width = int(width_entry.get()) # Retained for potential legacy use, TARGET_WIDTH/HEIGHT is primary
-            height = int(height_entry.get()) # Retained for potential legacy use, TARGET_WIDTH/HEIGHT is primary
+            settings = self.settings_from_widgets(
+                width_entry, height_entry, show_names, use_watermark, watermark_path_var, watermark_position, selected_font,
+                blur_slider.get(), brightness_slider.get(), spacing_slider.get(), size_main_slider.get(), size_accessory_slider.get(),
+                accessory_count_slider_obj.get(), actual_object_spacing_slider_obj.get(), font_color_rgb, format_combo=format_combo)
             quantity = int(quantity_spinbox.get())
             output_folder = output_entry.get()
 
-            if not output_folder or not os.path.exists(output_folder): # Ensure output folder is selected and exists
-                messagebox.showerror("Errore", "Seleziona una cartella di salvataggio valida.")
-                return
-
-            # Check if essential category paths are selected (assuming tk.StringVar for paths)
-            # If category_paths stores StringVars from the GUI, .get() would be needed here.
-            # Current implementation assumes paths are direct strings after __init__ or GUI updates.
-            if not self.category_paths.get("maglie") or not self.load_images_from_folder(self.category_paths["maglie"]):
-                 messagebox.showerror("Errore", "La cartella 'maglie' non è selezionata o non contiene immagini.")
-                 return
-            if not self.category_paths.get("pantaloni") or not self.load_images_from_folder(self.category_paths["pantaloni"]):
-                 messagebox.showerror("Errore", "La cartella 'pantaloni' non è selezionata o non contiene immagini.")
-                 return
-            if not self.category_paths.get("sfondi") or not self.load_images_from_folder(self.category_paths["sfondi"]):
-                 messagebox.showerror("Errore", "La cartella 'sfondi' non è selezionata o non contiene immagini.")
-                 return
-
-            category_images = {category: self.load_images_from_folder(self.category_paths[category]) for category in self.accessory_types if self.category_paths.get(category)}
-
-
-            optional_accessories = [cat for cat in self.accessory_types if cat not in ["maglie", "pantaloni", "sfondi"]]
-            # Corrected: Use accessory_count_slider_obj for max_accessories
-            max_accessories = max(2, accessory_count_slider_obj.get())
-
-            font = None
-            font_size = 30 # Default font size
-            if show_names.get():
-                selected_font_name = selected_font.get()
-                if selected_font_name == "Random":
-                    available_font_names = [f for f in self.available_fonts if f != "Random"]
-                    if available_font_names:
-                        selected_font_name = random.choice(available_font_names)
-                    else:
-                        selected_font_name = None
-                if selected_font_name and selected_font_name in self.font_objects:
-                    try:
-                        font = ImageFont.truetype(self.font_objects[selected_font_name], font_size)
-                    except Exception as e:
-                        messagebox.showwarning("Attenzione", f"Errore nel caricamento del font: {e}. Uso font predefinito.")
-                        font = ImageFont.load_default()
-                else:
-                    font = ImageFont.load_default()
-
-            for i in range(quantity):
-                canvas = Image.new("RGBA", (self.TARGET_WIDTH, self.TARGET_HEIGHT), (255, 255, 255, 0))
-
-                # Sfondo
-                if random.random() < 0.6:
-                    background = self.neutral_background(self.TARGET_WIDTH, self.TARGET_HEIGHT)
-                else:
-                    background_path = random.choice([img[0] for img in category_images["sfondi"]])
-                    background = self.fix_image_orientation(Image.open(background_path).convert("RGBA"))
-                    background = background.resize((self.TARGET_WIDTH, self.TARGET_HEIGHT), Image.Resampling.LANCZOS)
-
-                # Effetti sfondo
-                blur_value = blur_slider.get()
-                if blur_value > 0:
-                    background = background.filter(ImageFilter.GaussianBlur(blur_value))
-
-                brightness_value = brightness_slider.get()
-                enhancer = ImageEnhance.Brightness(background)
-                background = enhancer.enhance(1 + brightness_value / 100)
-
-                canvas.paste(background, (0, 0))
-                draw = ImageDraw.Draw(canvas)
-
-                occupied_areas = []
-
-                # Parametri di ridimensionamento
-                size_main_factor = size_main_slider.get() / 100
-                size_accessory_factor = size_accessory_slider.get() / 100
-                # Corrected: Use actual_object_spacing_slider_obj for object_spacing
-                object_spacing = actual_object_spacing_slider_obj.get() * 2
-                # spacing is for vertical distance between shirt and pants
-                spacing = spacing_slider.get() * 3
-
-                content_width_for_main_items = self.TARGET_WIDTH - 2 * self.ACCESSORY_MARGIN
-                content_height_for_main_items = self.TARGET_HEIGHT - 2 * self.ACCESSORY_MARGIN
-
-                # Dimensioni degli oggetti principali
-                shirt_max_width = int(content_width_for_main_items * 0.5 * size_main_factor)
-                shirt_max_height = int(content_height_for_main_items * 0.35 * size_main_factor)
-                pants_max_width = int(content_width_for_main_items * 0.5 * size_main_factor)
-                pants_max_height = int(content_height_for_main_items * 0.35 * size_main_factor)
-
-                # Carica maglia e pantaloni
-                shirt_data = random.choice(category_images["maglie"])
-                shirt_img = self.fix_image_orientation(Image.open(shirt_data[0]).convert("RGBA"))
-                shirt_img = self.resize_image(shirt_img, shirt_max_width, shirt_max_height)
-                shirt_name = shirt_data[1]
-
-                pants_data = random.choice(category_images["pantaloni"])
-                pants_img = self.fix_image_orientation(Image.open(pants_data[0]).convert("RGBA"))
-                pants_img = self.resize_image(pants_img, pants_max_width, pants_max_height)
-                pants_name = pants_data[1]
-
-                # --- Main Garment Placement Strategy ---
-                # Randomly chooses 'center', 'left', or 'right' for the main garment block.
-                placement_options = ['center', 'left', 'right']
-                chosen_placement = random.choice(placement_options)
-
-                # Usable area for content, excluding accessory margins.
-                content_width = self.TARGET_WIDTH - 2 * self.ACCESSORY_MARGIN
-                content_height = self.TARGET_HEIGHT - 2 * self.ACCESSORY_MARGIN # For vertical centering of garment block
-
-                # X-coordinate calculation based on chosen placement
-                offset_amount = content_width // 7 # Amount to shift for 'left'/'right' placements
-
-                if chosen_placement == 'center':
-                    shirt_x = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                    pants_x = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-                elif chosen_placement == 'left':
-                    # Calculate centered position first, then apply offset
-                    base_center_x_shirt = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                    base_center_x_pants = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-                    shirt_x = base_center_x_shirt - offset_amount
-                    pants_x = base_center_x_pants - offset_amount
-                elif chosen_placement == 'right':
-                    # Calculate centered position first, then apply offset
-                    base_center_x_shirt = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                    base_center_x_pants = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-                    shirt_x = base_center_x_shirt + offset_amount
-                    pants_x = base_center_x_pants + offset_amount
-
-                # Ensure x positions are firmly within accessory margins and don't push content outside visual bounds.
-                # The min second argument should be the rightmost allowed start for the image.
-                shirt_x = max(self.ACCESSORY_MARGIN, min(shirt_x, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - shirt_img.width))
-                pants_x = max(self.ACCESSORY_MARGIN, min(pants_x, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - pants_img.width))
-
-                total_garment_height = shirt_img.height + pants_img.height + spacing
-
-                # Calculate initial Y to center the block within the content height
-                shirt_y = self.ACCESSORY_MARGIN + (content_height - total_garment_height) // 2
-
-                # Ensure shirt_y respects the top accessory margin
-                shirt_y = max(self.ACCESSORY_MARGIN, shirt_y)
-
-                # Ensure the entire block does not go below the bottom accessory margin
-                # (i.e., shirt_y + total_garment_height should not exceed self.TARGET_HEIGHT - self.ACCESSORY_MARGIN)
-                if shirt_y + total_garment_height > self.TARGET_HEIGHT - self.ACCESSORY_MARGIN:
-                    shirt_y = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - total_garment_height
-                    # Re-check against top margin in case of very large items
-                    shirt_y = max(self.ACCESSORY_MARGIN, shirt_y)
-
-                pants_y = shirt_y + shirt_img.height + spacing
-
-                canvas.paste(shirt_img, (shirt_x, shirt_y), shirt_img)
-                occupied_areas.append((shirt_x, shirt_y, shirt_img.width, shirt_img.height))
-
-                if show_names.get():
-                    text_width = draw.textlength(shirt_name, font=font) if font else 100
-                    text_x = shirt_x + (shirt_img.width - text_width) // 2
-                    text_y = shirt_y + shirt_img.height + 10
-                    if text_x + text_width > self.TARGET_WIDTH - self.ACCESSORY_MARGIN:
-                        text_x = self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width
-                    if text_y + font_size > self.TARGET_HEIGHT - self.ACCESSORY_MARGIN: # Using font_size as proxy for text_height
-                        text_y = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size
-                    font_color = font_color_rgb
-                    draw.text((text_x, text_y), shirt_name, font=font, fill=font_color)
-                    occupied_areas.append((text_x, text_y, text_width, font_size))
-
-                canvas.paste(pants_img, (pants_x, pants_y), pants_img)
-                occupied_areas.append((pants_x, pants_y, pants_img.width, pants_img.height))
-
-                if show_names.get():
-                    text_width = draw.textlength(pants_name, font=font) if font else 100
-                    text_x = pants_x + (pants_img.width - text_width) // 2
-                    text_y = pants_y + pants_img.height + 10
-                    if text_x + text_width > self.TARGET_WIDTH - self.ACCESSORY_MARGIN:
-                        text_x = self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width
-                    if text_y + font_size > self.TARGET_HEIGHT - self.ACCESSORY_MARGIN: # Using font_size as proxy for text_height
-                        text_y = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size
-                    font_color = font_color_rgb
-                    draw.text((text_x, text_y), pants_name, font=font, fill=font_color)
-                    occupied_areas.append((text_x, text_y, text_width, font_size))
-
-                # Posizionamento watermark (DO THIS AFTER ALL ITEMS AND THEIR TEXT ARE PLACED)
-                # The code structure should be:
-                # 1. Place shirt, pants + their text names (add to occupied_areas)
-                # 2. Place accessories + their text names (add to occupied_areas)
-                # 3. Then, do watermark logic. (This means moving this block further down if it's not already)
-                # Assuming this block is already correctly positioned logically after all items and names:
-
-                if use_watermark.get() and watermark_path_var.get():
-                    watermark_original = self.fix_image_orientation(Image.open(watermark_path_var.get()).convert("RGBA"))
-
-                    max_wm_width = int(self.TARGET_WIDTH * 0.25)
-                    watermark = watermark_original # Use 'watermark' for the potentially resized version
-
-                    if watermark.width > max_wm_width:
-                        aspect_ratio = watermark.height / watermark.width
-                        new_wm_width = max_wm_width
-                        new_wm_height = int(new_wm_width * aspect_ratio)
-                        if new_wm_height > 0:
-                            watermark = watermark.resize((new_wm_width, new_wm_height), Image.Resampling.LANCZOS)
-                        else:
-                            print(f"Warning: Watermark ({watermark_path_var.get()}) resized to zero height. Skipping.")
-                            watermark = None # Skip if resizing leads to invalid dimensions
-
-                    if watermark: # Proceed if watermark is valid
-                        padding_top = self.WATERMARK_MARGIN_TOP
-                        padding_bottom = self.WATERMARK_MARGIN_BOTTOM_TIKTOK
-
-                        if watermark_position.get() == "Sopra":
-                            wm_y = padding_top
-                        else: # "Sotto"
-                            wm_y = self.TARGET_HEIGHT - watermark.height - padding_bottom
-
-                        wm_x = (self.TARGET_WIDTH - watermark.width) // 2
-
-                        watermark_rect = (wm_x, wm_y, watermark.width, watermark.height)
-                        watermark_overlaps = False
-                        for occ_x, occ_y, occ_w, occ_h in occupied_areas:
-                            if (watermark_rect[0] < occ_x + occ_w and
-                                watermark_rect[0] + watermark_rect[2] > occ_x and
-                                watermark_rect[1] < occ_y + occ_h and
-                                watermark_rect[1] + watermark_rect[3] > occ_y):
-                                watermark_overlaps = True
-                                break
-
-                        if not watermark_overlaps:
-                            canvas.paste(watermark, (wm_x, wm_y), watermark)
-                            # DO NOT add to occupied_areas as per instruction for one-way overlap check
-                        else:
-                            print(f"Warning: Watermark placement at ({wm_x}, {wm_y}) would overlap with existing items. Skipping watermark.")
-
-                # ---- Accessory Placement Setup ----
-                # Defines zones (left/right of garments) based on main garment placement.
-                # `object_spacing` is used to ensure accessories don't touch the garment block directly.
-                garment_block_x_start = min(shirt_x, pants_x)
-                garment_block_x_end = max(shirt_x + shirt_img.width, pants_x + pants_img.width)
-
-                accessory_zones = []
-                zone_y_start = self.ACCESSORY_MARGIN
-                zone_y_end = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN
-
-                if chosen_placement == 'center':
-                    # Zone to the left of centered garments
-                    accessory_zones.append({
-                        "id": "left_of_center",
-                        "x_start": self.ACCESSORY_MARGIN,
-                        "x_end": garment_block_x_start - object_spacing,
-                        "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "left"
-                    })
-                    # Zone to the right of centered garments
-                    accessory_zones.append({
-                        "id": "right_of_center",
-                        "x_start": garment_block_x_end + object_spacing,
-                        "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN,
-                        "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "right"
-                    })
-                elif chosen_placement == 'left':
-                    # Primary zone is to the right of left-placed garments
-                    accessory_zones.append({
-                        "id": "right_of_left_garments",
-                        "x_start": garment_block_x_end + object_spacing,
-                        "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN,
-                        "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "right"
-                    })
-                elif chosen_placement == 'right':
-                    # Primary zone is to the left of right-placed garments
-                    accessory_zones.append({
-                        "id": "left_of_right_garments",
-                        "x_start": self.ACCESSORY_MARGIN,
-                        "x_end": garment_block_x_start - object_spacing,
-                        "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "left"
-                    })
-
-                # Filter out zones that are too narrow or short.
-                accessory_zones = [z for z in accessory_zones if z["x_end"] - z["x_start"] > 50 and z["y_end"] - z["y_start"] > 50]
-
-                # Fallback: If specific zones are invalid (e.g., garments too wide), use the whole content area.
-                if not accessory_zones:
-                     accessory_zones.append({
-                        "id": "full_content_area_fallback",
-                        "x_start": self.ACCESSORY_MARGIN, "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN,
-                        "y_start": self.ACCESSORY_MARGIN, "y_end": self.TARGET_HEIGHT - self.ACCESSORY_MARGIN,
-                        "target_side": "none"
-                    })
-
-                # --- Accessory Selection and Prioritization ---
-                # Selects accessories based on defined priorities and available images.
-                # `optional_accessories` was defined earlier.
-                available_accessories_with_images = [cat for cat in optional_accessories if category_images.get(cat)] # Check if cat images are loaded
-
-                # Sorts by priority (lower number = higher priority), then shuffles within each priority group.
-                sorted_accessories = sorted(
-                    available_accessories_with_images,
-                    key=lambda cat: (self.ACCESSORY_PRIORITIES.get(cat, self.DEFAULT_PRIORITY), random.random())
-                )
-
-                num_to_select = min(max_accessories, len(sorted_accessories))
-                selected_accessories = sorted_accessories[:num_to_select] # Top N accessories are selected.
-                # These will be attempted for placement in this priority order.
-
-                # Dimensioni degli accessori per categoria
-                accessory_sizes = {
-                    "occhiali": (0.15 * size_accessory_factor, 0.15 * size_main_factor),
-                    "wallet": (0.15 * size_accessory_factor, 0.15 * size_main_factor),
-                    "profumi": (0.2 * size_accessory_factor, 0.2 * size_main_factor),
-                    "bracciali": (0.1 * size_accessory_factor, 0.1 * size_main_factor),
-                    "orologi": (0.1 * size_accessory_factor, 0.1 * size_main_factor),
-                    "cinture": (0.2 * size_accessory_factor, 0.2 * size_main_factor),
-                    "scarpe": (0.25 * size_accessory_factor, 0.25 * size_main_factor),
-                    "auto": (0.4 * size_accessory_factor, 0.4 * size_main_factor)
-                }
-
-                for accessory in selected_accessories:
-                    item_data = random.choice(category_images[accessory])
-                    item_img_original = self.fix_image_orientation(Image.open(item_data[0]).convert("RGBA"))
-
-                    # Resize based on category-specific factors, using content_width/height as reference
-                    size_rules = accessory_sizes.get(accessory, (0.15, 0.15)) # Default size if not in rules
-                    max_item_w = int(content_width_for_main_items * size_rules[0] * size_accessory_factor)
-                    max_item_h = int(content_height_for_main_items * size_rules[1] * size_accessory_factor)
-                    item_img = self.resize_image(item_img_original, max_item_w, max_item_h)
-                    item_name = item_data[1]
-
-                    # --- Initial Semantic Placement ---
-                    x, y = 0, 0 # Default, will be updated
-
-                    if accessory == "occhiali":
-                        x = shirt_x + (shirt_img.width - item_img.width) // 2
-                        y = shirt_y - item_img.height - (object_spacing // 4 if object_spacing > 10 else 5) # Place slightly above shirt
-                    elif accessory == "cinture":
-                        x = shirt_x + (shirt_img.width - item_img.width) // 2
-                        y = shirt_y + shirt_img.height - item_img.height // 2 + spacing // 3 # Between shirt and pants like
-                    elif accessory == "scarpe":
-                        x = pants_x + (pants_img.width - item_img.width) // 2
-                        y = pants_y + pants_img.height + (object_spacing // 4 if object_spacing > 10 else 5)
-                    elif accessory == "auto": # Special handling for 'auto'
-                        # Try to place in the largest available zone, or fallback to margin-aware placement
-                        if accessory_zones:
-                            largest_zone = max(accessory_zones, key=lambda z: (z["x_end"] - z["x_start"]) * (z["y_end"] - z["y_start"]))
-                            x = largest_zone["x_start"] + (largest_zone["x_end"] - largest_zone["x_start"] - item_img.width) // 2
-                            y = largest_zone["y_start"] + (largest_zone["y_end"] - largest_zone["y_start"] - item_img.height) // 2
-                        else: # Fallback if no zones defined (should not happen with the fallback zone logic)
-                            x = random.choice([self.ACCESSORY_MARGIN, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - item_img.width])
-                            y = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - item_img.height
-                    # For "bracciali", "orologi", "wallet", "profumi", we'll let the zone selection guide initial x,y more directly.
-                    # Their initial x,y will be calculated within the chosen zone during the attempt loop.
-
-                    # --- Collision Avoidance and Zone-based Placement Loop ---
-                    attempts = 0
-                    max_attempts_per_zone = 15
-                    max_total_attempts = 50
-                    placed = False
-
-                    # Store semantic starting point if calculated, otherwise it will be zone-based
-                    semantic_x, semantic_y = x, y
-
-                    # Shuffle zones to try different areas if the first choice is crowded
-                    shuffled_zones = random.sample(accessory_zones, len(accessory_zones)) if accessory_zones else []
-
-                    for current_zone in shuffled_zones:
-                        if placed: break
-
-                        # Determine initial placement within the current_zone
-                        # For specific items, use semantic. For others, center in zone or random.
-                        if accessory in ["occhiali", "cinture", "scarpe"]:
-                            current_x = semantic_x
-                            current_y = semantic_y
-                        elif accessory in ["bracciali", "orologi"]:
-                             # Try to place on the target_side of the zone, near garments
-                            if current_zone["target_side"] == "left":
-                                current_x = current_zone["x_end"] - item_img.width - (object_spacing //2) # Near garment block
-                            elif current_zone["target_side"] == "right":
-                                current_x = current_zone["x_start"] + (object_spacing //2) # Near garment block
-                            else: # center placement
-                                current_x = current_zone["x_start"] + (current_zone["x_end"] - current_zone["x_start"] - item_img.width) // 2
-                            current_y = shirt_y + shirt_img.height // 3 # Example y, adjust per item
-
-                        else: # "wallet", "profumi", etc. - more flexible
-                            current_x = random.randint(current_zone["x_start"], max(current_zone["x_start"], current_zone["x_end"] - item_img.width))
-                            current_y = random.randint(current_zone["y_start"], max(current_zone["y_start"], current_zone["y_end"] - item_img.height))
-
-
-                        for attempt_in_zone in range(max_attempts_per_zone):
-                            if attempts >= max_total_attempts: break
-
-                            shift_x = random.randint(-15, 15)
-                            shift_y = random.randint(-15, 15)
-                            final_x = current_x + shift_x
-                            final_y = current_y + shift_y
-
-                            # Clamp to current zone boundaries
-                            final_x = max(current_zone["x_start"], min(final_x, current_zone["x_end"] - item_img.width))
-                            final_y = max(current_zone["y_start"], min(final_y, current_zone["y_end"] - item_img.height))
-
-                            # Final check against overall canvas safety using ACCESSORY_MARGIN (is_position_safe)
-                            if not self.is_position_safe(final_x, final_y, item_img.width, item_img.height):
-                                attempts += 1
-                                continue
-
-                            overlaps = False
-                            for occ_x, occ_y, occ_w, occ_h in occupied_areas:
-                                if (final_x < occ_x + occ_w + object_spacing and
-                                    final_x + item_img.width > occ_x - object_spacing and
-                                    final_y < occ_y + occ_h + object_spacing and
-                                    final_y + item_img.height > occ_y - object_spacing):
-                                    overlaps = True
-                                    break
-
-                            if not overlaps:
-                                x, y = final_x, final_y
-                                placed = True
-                                break
-                            attempts += 1
-                        if placed: break
-
-                    if not placed:
-                        continue
-
-                    canvas.paste(item_img, (x, y), item_img)
-                    occupied_areas.append((x, y, item_img.width, item_img.height))
-
-                    if show_names.get():
-                        text_width = draw.textlength(item_name, font=font) if font else 100 # Get text width
-                        # Ensure text_x is within bounds
-                        text_x = x + (item_img.width - text_width) // 2
-                        text_x = max(self.ACCESSORY_MARGIN, min(text_x, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width))
-
-                        # Ensure text_y is within bounds
-                        text_y = y + item_img.height + 5 # Small gap for text below item
-                        text_y = max(self.ACCESSORY_MARGIN, min(text_y, self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size))
-
-                        # Check if text placement itself is safe (not overlapping other things)
-                        # This is a simplified check; a more robust check would add text bounds to occupied_areas
-                        # For now, rely on the general clamping and hope for the best for text overlaps.
-                        draw.text((text_x, text_y), item_name, font=font, fill=font_color_rgb)
-                        # Optionally, add text bounding box to occupied_areas if text overlap becomes an issue
-                        # occupied_areas.append((text_x, text_y, text_width, font_size))
-
-                # Salva l'immagine
-                # **IMPORTANT**: The watermark logic MUST be executed AFTER all item names are drawn and added to occupied_areas
-                # but BEFORE this "Salva l'immagine" step.
-                # The previous diff block for watermark placement should conceptually be here if it's not already.
-
-                output_format = format_combo.get().lower()
-                base_filename = f"outfit_{i+1}.{output_format}" # Ensure i is defined in this scope; it comes from the loop `for i in range(quantity):`
-                unique_filename = self.get_unique_filename(output_folder, base_filename)
-                output_path = os.path.join(output_folder, unique_filename)
-                canvas = canvas.convert("RGB") if output_format == "jpg" else canvas
-                canvas.save(output_path, quality=95 if output_format == "jpg" else None)
-
-            messagebox.showinfo("Successo", f"{quantity} immagini generate con successo in {output_folder}!")
+            batch_seed = self.new_seed()
+            self.render_batch(settings, quantity, output_folder, seed=batch_seed)
+            messagebox.showinfo("Successo", f"{quantity} immagini generate con successo in {output_folder}! (seed {batch_seed})")
+        except OutfitGenerationError as e:
+            messagebox.showerror("Errore", str(e))
         except Exception as e:
             traceback.print_exc()
             messagebox.showerror("Errore", f"Si è verificato un errore: {str(e)}")
 
-    # Helper functions for contrast check
     def get_average_color(self, image_obj, box=None):
         target_image = image_obj
         if box:
@@ -739,382 +1408,22 @@ class OutfitGeneratorLogic:
         return (l1 + 0.05) / (l2 + 0.05)
 
     def generate_single_outfit_preview(self, width_entry, height_entry, show_names, use_watermark, watermark_path_var, watermark_position, selected_font, blur_slider_val, brightness_slider_val, spacing_slider_val, size_main_slider_val, size_accessory_slider_val, accessory_count_val, object_spacing_val, font_color_rgb, root):
+        from tkinter import messagebox
         try:
-            # width and height from entry are not directly used for canvas size, TARGET_WIDTH/HEIGHT are.
-            # They might be used for other calculations if not refactored out yet.
-            # For preview, these specific entries might be less relevant if a fixed preview size is desired.
-            # However, keeping them for consistency with generate_outfits structure for now.
-            width = int(width_entry.get())
-            height = int(height_entry.get())
-
-            # Directly use passed values from sliders
-            blur_value = blur_slider_val
-            brightness_value = brightness_slider_val
-            spacing = spacing_slider_val * 3 # Matches original logic: spacing_slider.get() * 3
-            size_main_factor = size_main_slider_val / 100
-            size_accessory_factor = size_accessory_slider_val / 100
-            max_accessories = max(2, accessory_count_val) # Renamed from object_spacing_slider
-            object_spacing = object_spacing_val * 2 # Renamed from object_spacing_slider
-
-            # Path checks for essential categories (assuming self.category_paths holds tk.StringVar or similar)
-            # For a preview, direct path access might be more robust if GUI elements aren't fully stable.
-            # This logic is retained from generate_outfits.
-            if not self.category_paths["maglie"].get() or not self.category_paths["pantaloni"].get() or not self.category_paths["sfondi"].get():
-                messagebox.showerror("Errore", "Seleziona almeno le cartelle per Maglie, Pantaloni e Sfondi.")
-                return None
-
-            category_images = {category: self.load_images_from_folder(self.category_paths[category].get()) for category in self.accessory_types}
-
-            if not category_images["maglie"]:
-                messagebox.showerror("Errore", "La cartella 'maglie' non contiene immagini valide.")
-                return None
-            if not category_images["pantaloni"]:
-                messagebox.showerror("Errore", "La cartella 'pantaloni' non contiene immagini valide.")
-                return None
-            if not category_images["sfondi"]: # Check for sfondi (backgrounds)
-                messagebox.showerror("Errore", "La cartella 'sfondi' non contiene immagini valide.")
-                return None
-
-
-            font = None
-            font_size = 30 # Default font size, consider making this a parameter if variable
-            if show_names.get():
-                selected_font_name = selected_font.get()
-                if selected_font_name == "Random":
-                    available_font_names = [f for f in self.available_fonts if f != "Random"]
-                    if available_font_names:
-                        selected_font_name = random.choice(available_font_names)
-                    else:
-                        selected_font_name = None # Fallback if only "Random" and no actual fonts
-
-                if selected_font_name and selected_font_name in self.font_objects:
-                    try:
-                        font = ImageFont.truetype(self.font_objects[selected_font_name], font_size)
-                    except Exception as e:
-                        messagebox.showwarning("Attenzione", f"Errore nel caricamento del font: {e}. Uso font predefinito.")
-                        font = ImageFont.load_default()
-                elif selected_font_name: # Font name selected but not found in objects (should not happen with proper loading)
-                     messagebox.showwarning("Attenzione", f"Font '{selected_font_name}' selezionato ma non trovato. Uso font predefinito.")
-                     font = ImageFont.load_default()
-                else: # No font selected or "Random" yielded no font
-                    font = ImageFont.load_default()
-
-
-            # --- Start of single image generation (adapted from the loop in generate_outfits) ---
-            canvas = Image.new("RGBA", (self.TARGET_WIDTH, self.TARGET_HEIGHT), (255, 255, 255, 0))
-
-            # Sfondo
-            if random.random() < 0.6: # 60% chance for neutral background
-                background = self.neutral_background(self.TARGET_WIDTH, self.TARGET_HEIGHT)
-            else:
-                # Ensure 'sfondi' images are available before choosing
-                sfondi_images = category_images.get("sfondi", [])
-                if not sfondi_images: # Should have been caught by initial checks, but as a safeguard
-                    messagebox.showerror("Errore", "Nessuna immagine di sfondo disponibile per la generazione.")
-                    return None # Or use neutral background as fallback
-                background_path = random.choice([img[0] for img in sfondi_images])
-                background = self.fix_image_orientation(Image.open(background_path).convert("RGBA"))
-                background = background.resize((self.TARGET_WIDTH, self.TARGET_HEIGHT), Image.Resampling.LANCZOS)
-
-            # Effetti sfondo
-            if blur_value > 0:
-                background = background.filter(ImageFilter.GaussianBlur(blur_value))
-
-            enhancer = ImageEnhance.Brightness(background)
-            background = enhancer.enhance(1 + brightness_value / 100)
-
-            canvas.paste(background, (0, 0))
-            draw = ImageDraw.Draw(canvas)
-            occupied_areas = [] # Stores (x, y, w, h) of placed items and text
-
-            # Calculate max dimensions for main garments based on content area and scaling factors
-            content_width_for_main_items = self.TARGET_WIDTH - 2 * self.ACCESSORY_MARGIN
-            content_height_for_main_items = self.TARGET_HEIGHT - 2 * self.ACCESSORY_MARGIN
-
-            shirt_max_width = int(content_width_for_main_items * 0.5 * size_main_factor)
-            shirt_max_height = int(content_height_for_main_items * 0.35 * size_main_factor)
-            pants_max_width = int(content_width_for_main_items * 0.5 * size_main_factor)
-            pants_max_height = int(content_height_for_main_items * 0.35 * size_main_factor)
-
-            # Load and resize main garments
-            # Ensure 'maglie' and 'pantaloni' images are available
-            if not category_images.get("maglie"): return None # Should be caught earlier
-            shirt_data = random.choice(category_images["maglie"])
-            shirt_img = self.fix_image_orientation(Image.open(shirt_data[0]).convert("RGBA"))
-            shirt_img = self.resize_image(shirt_img, shirt_max_width, shirt_max_height)
-            shirt_name = shirt_data[1]
-
-            if not category_images.get("pantaloni"): return None # Should be caught earlier
-            pants_data = random.choice(category_images["pantaloni"])
-            pants_img = self.fix_image_orientation(Image.open(pants_data[0]).convert("RGBA"))
-            pants_img = self.resize_image(pants_img, pants_max_width, pants_max_height)
-            pants_name = pants_data[1]
-
-            # --- Main Garment Placement Strategy ---
-            # Determines if the shirt/pants block is centered, or shifted left/right.
-            placement_options = ['center', 'left', 'right']
-            chosen_placement = random.choice(placement_options) # Randomly select one strategy
-
-            # Usable width and height for content, excluding margins
-            content_width = self.TARGET_WIDTH - 2 * self.ACCESSORY_MARGIN
-            content_height = self.TARGET_HEIGHT - 2 * self.ACCESSORY_MARGIN # For vertical centering
-
-            # Offset for 'left'/'right' placements
-            offset_amount = content_width // 7 # Arbitrary shift amount, 1/7th of content width
-
-            # Calculate X coordinates based on chosen placement
-            if chosen_placement == 'center':
-                shirt_x = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                pants_x = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-            elif chosen_placement == 'left':
-                base_center_x_shirt = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                base_center_x_pants = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-                shirt_x = base_center_x_shirt - offset_amount
-                pants_x = base_center_x_pants - offset_amount
-            elif chosen_placement == 'right':
-                base_center_x_shirt = self.ACCESSORY_MARGIN + (content_width - shirt_img.width) // 2
-                base_center_x_pants = self.ACCESSORY_MARGIN + (content_width - pants_img.width) // 2
-                shirt_x = base_center_x_shirt + offset_amount
-                pants_x = base_center_x_pants + offset_amount
-
-            shirt_x = max(self.ACCESSORY_MARGIN, min(shirt_x, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - shirt_img.width))
-            pants_x = max(self.ACCESSORY_MARGIN, min(pants_x, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - pants_img.width))
-
-            total_garment_height = shirt_img.height + pants_img.height + spacing
-            shirt_y = self.ACCESSORY_MARGIN + (content_height - total_garment_height) // 2
-            shirt_y = max(self.ACCESSORY_MARGIN, shirt_y)
-            if shirt_y + total_garment_height > self.TARGET_HEIGHT - self.ACCESSORY_MARGIN:
-                shirt_y = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - total_garment_height
-                shirt_y = max(self.ACCESSORY_MARGIN, shirt_y)
-            pants_y = shirt_y + shirt_img.height + spacing
-
-            canvas.paste(shirt_img, (shirt_x, shirt_y), shirt_img)
-            occupied_areas.append((shirt_x, shirt_y, shirt_img.width, shirt_img.height))
-            # Contrast check for shirt
-            shirt_box_on_canvas = (shirt_x, shirt_y, shirt_x + shirt_img.width, shirt_y + shirt_img.height)
-            avg_shirt_color = self.get_average_color(shirt_img)
-            avg_bg_color_shirt = self.get_average_color(canvas, box=shirt_box_on_canvas)
-            lum_shirt = self.get_relative_luminance(avg_shirt_color)
-            lum_bg_shirt = self.get_relative_luminance(avg_bg_color_shirt)
-            contrast_shirt = self.get_contrast_ratio(lum_shirt, lum_bg_shirt)
-            if contrast_shirt < self.MIN_CONTRAST_THRESHOLD:
-                print(f"Warning: Low contrast ({contrast_shirt:.2f}) for SHIRT. Item color: {avg_shirt_color}, Bg color: {avg_bg_color_shirt}")
-
-            if show_names.get():
-                text_width_shirt = draw.textlength(shirt_name, font=font) if font else 0
-                text_x_shirt = shirt_x + (shirt_img.width - text_width_shirt) // 2
-                text_y_shirt = shirt_y + shirt_img.height + 5 # Small gap
-                text_x_shirt = max(self.ACCESSORY_MARGIN, min(text_x_shirt, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width_shirt))
-                text_y_shirt = max(self.ACCESSORY_MARGIN, min(text_y_shirt, self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size))
-                draw.text((text_x_shirt, text_y_shirt), shirt_name, font=font, fill=font_color_rgb)
-                if text_width_shirt > 0 :
-                    occupied_areas.append((text_x_shirt, text_y_shirt, text_width_shirt, font_size))
-                    # Contrast check for shirt text
-                    text_bbox_shirt = (text_x_shirt, text_y_shirt, text_x_shirt + text_width_shirt, text_y_shirt + font_size)
-                    avg_text_bg_color_shirt = self.get_average_color(canvas, box=text_bbox_shirt)
-                    lum_text_shirt = self.get_relative_luminance(font_color_rgb)
-                    lum_text_bg_shirt = self.get_relative_luminance(avg_text_bg_color_shirt)
-                    text_contrast_shirt = self.get_contrast_ratio(lum_text_shirt, lum_text_bg_shirt)
-                    if text_contrast_shirt < self.MIN_TEXT_CONTRAST_THRESHOLD:
-                        print(f"Warning: Low contrast ({text_contrast_shirt:.2f}) for SHIRT TEXT '{shirt_name}'. Text: {font_color_rgb}, Bg: {avg_text_bg_color_shirt}")
-
-
-            canvas.paste(pants_img, (pants_x, pants_y), pants_img)
-            occupied_areas.append((pants_x, pants_y, pants_img.width, pants_img.height))
-            # Contrast check for pants
-            pants_box_on_canvas = (pants_x, pants_y, pants_x + pants_img.width, pants_y + pants_img.height)
-            avg_pants_color = self.get_average_color(pants_img)
-            avg_bg_color_pants = self.get_average_color(canvas, box=pants_box_on_canvas)
-            lum_pants = self.get_relative_luminance(avg_pants_color)
-            lum_bg_pants = self.get_relative_luminance(avg_bg_color_pants)
-            contrast_pants = self.get_contrast_ratio(lum_pants, lum_bg_pants)
-            if contrast_pants < self.MIN_CONTRAST_THRESHOLD:
-                print(f"Warning: Low contrast ({contrast_pants:.2f}) for PANTS. Item color: {avg_pants_color}, Bg color: {avg_bg_color_pants}")
-
-            if show_names.get():
-                text_width_pants = draw.textlength(pants_name, font=font) if font else 0
-                text_x_pants = pants_x + (pants_img.width - text_width_pants) // 2
-                text_y_pants = pants_y + pants_img.height + 5
-                text_x_pants = max(self.ACCESSORY_MARGIN, min(text_x_pants, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width_pants))
-                text_y_pants = max(self.ACCESSORY_MARGIN, min(text_y_pants, self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size))
-                draw.text((text_x_pants, text_y_pants), pants_name, font=font, fill=font_color_rgb)
-                if text_width_pants > 0:
-                    occupied_areas.append((text_x_pants, text_y_pants, text_width_pants, font_size))
-                    # Contrast check for pants text
-                    text_bbox_pants = (text_x_pants, text_y_pants, text_x_pants + text_width_pants, text_y_pants + font_size)
-                    avg_text_bg_color_pants = self.get_average_color(canvas, box=text_bbox_pants)
-                    lum_text_pants = self.get_relative_luminance(font_color_rgb)
-                    lum_text_bg_pants = self.get_relative_luminance(avg_text_bg_color_pants)
-                    text_contrast_pants = self.get_contrast_ratio(lum_text_pants, lum_text_bg_pants)
-                    if text_contrast_pants < self.MIN_TEXT_CONTRAST_THRESHOLD:
-                        print(f"Warning: Low contrast ({text_contrast_pants:.2f}) for PANTS TEXT '{pants_name}'. Text: {font_color_rgb}, Bg: {avg_text_bg_color_pants}")
-
-            # --- Accessory Zone Definition ---
-            # Defines areas where accessories can be placed, based on main garment position.
-            garment_block_x_start = min(shirt_x, pants_x)
-            garment_block_x_end = max(shirt_x + shirt_img.width, pants_x + pants_img.width)
-            accessory_zones = []
-            zone_y_start = self.ACCESSORY_MARGIN
-            zone_y_end = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN # Full height within margins
-
-            if chosen_placement == 'center':
-                # Zone to the left of centered garments
-                accessory_zones.append({"id": "left_of_center", "x_start": self.ACCESSORY_MARGIN, "x_end": garment_block_x_start - object_spacing, "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "left"})
-                # Zone to the right of centered garments
-                accessory_zones.append({"id": "right_of_center", "x_start": garment_block_x_end + object_spacing, "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN, "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "right"})
-            elif chosen_placement == 'left':
-                # Primary zone is to the right of left-placed garments
-                accessory_zones.append({"id": "right_of_left_garments", "x_start": garment_block_x_end + object_spacing, "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN, "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "right"})
-            elif chosen_placement == 'right':
-                # Primary zone is to the left of right-placed garments
-                accessory_zones.append({"id": "left_of_right_garments", "x_start": self.ACCESSORY_MARGIN, "x_end": garment_block_x_start - object_spacing, "y_start": zone_y_start, "y_end": zone_y_end, "target_side": "left"})
-
-            # Filter out zones that are too small (e.g., if garments + spacing are very wide)
-            accessory_zones = [z for z in accessory_zones if z["x_end"] - z["x_start"] > 50 and z["y_end"] - z["y_start"] > 50] # Min 50px usable width/height
-
-            # Fallback if no specific zones are valid (e.g., garments too wide)
-            if not accessory_zones:
-                accessory_zones.append({"id": "full_content_area_fallback", "x_start": self.ACCESSORY_MARGIN, "x_end": self.TARGET_WIDTH - self.ACCESSORY_MARGIN, "y_start": self.ACCESSORY_MARGIN, "y_end": self.TARGET_HEIGHT - self.ACCESSORY_MARGIN, "target_side": "none"})
-
-            # --- Accessory Selection by Priority ---
-            # Selects which accessories to attempt to place based on predefined priorities.
-            optional_accessories = [cat for cat in self.accessory_types if cat not in ["maglie", "pantaloni", "sfondi"]]
-            available_accessories_with_images = [cat for cat in optional_accessories if category_images.get(cat)] # Ensure images are loaded
-
-            # Sorts by priority (lower number = higher), then shuffles within each priority group for variety.
-            sorted_accessories = sorted(available_accessories_with_images, key=lambda cat: (self.ACCESSORY_PRIORITIES.get(cat, self.DEFAULT_PRIORITY), random.random()))
-
-            num_to_select = min(max_accessories, len(sorted_accessories)) # Use max_accessories from slider
-            selected_accessories = sorted_accessories[:num_to_select] # These will be attempted in order.
-
-            accessory_sizes = {"occhiali": (0.15, 0.15),"wallet": (0.15,0.15),"profumi": (0.2,0.2),"bracciali": (0.1,0.1),"orologi": (0.1,0.1),"cinture": (0.2,0.2),"scarpe": (0.25,0.25),"auto": (0.4,0.4)} # Relative size factors
-
-            for accessory in selected_accessories:
-                item_data = random.choice(category_images[accessory]) # Pick a random item from the chosen category
-                item_img_original = self.fix_image_orientation(Image.open(item_data[0]).convert("RGBA"))
-                size_rules = accessory_sizes.get(accessory, (0.15, 0.15))
-                max_item_w = int(content_width_for_main_items * size_rules[0] * size_accessory_factor)
-                max_item_h = int(content_height_for_main_items * size_rules[1] * size_accessory_factor)
-                item_img = self.resize_image(item_img_original, max_item_w, max_item_h)
-                item_name = item_data[1]
-
-                x_acc, y_acc = 0,0 # Default for accessory x,y before semantic placement
-                if accessory == "occhiali":
-                    x_acc = shirt_x + (shirt_img.width - item_img.width) // 2
-                    y_acc = shirt_y - item_img.height - (object_spacing // 4 if object_spacing > 10 else 5)
-                elif accessory == "cinture":
-                    x_acc = shirt_x + (shirt_img.width - item_img.width) // 2
-                    y_acc = shirt_y + shirt_img.height - item_img.height // 2 + spacing // 3
-                elif accessory == "scarpe":
-                    x_acc = pants_x + (pants_img.width - item_img.width) // 2
-                    y_acc = pants_y + pants_img.height + (object_spacing // 4 if object_spacing > 10 else 5)
-                elif accessory == "auto":
-                    if accessory_zones:
-                        largest_zone = max(accessory_zones, key=lambda z: (z["x_end"] - z["x_start"]) * (z["y_end"] - z["y_start"]))
-                        x_acc = largest_zone["x_start"] + (largest_zone["x_end"] - largest_zone["x_start"] - item_img.width) // 2
-                        y_acc = largest_zone["y_start"] + (largest_zone["y_end"] - largest_zone["y_start"] - item_img.height) // 2
-                    else:
-                        x_acc = random.choice([self.ACCESSORY_MARGIN, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - item_img.width])
-                        y_acc = self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - item_img.height
-
-                attempts_acc = 0
-                max_attempts_per_zone_acc = 15
-                max_total_attempts_acc = 50
-                placed_acc = False
-                semantic_x_acc, semantic_y_acc = x_acc, y_acc
-                shuffled_zones_acc = random.sample(accessory_zones, len(accessory_zones)) if accessory_zones else []
-
-                for current_zone_acc in shuffled_zones_acc:
-                    if placed_acc: break
-                    current_x_loop, current_y_loop = x_acc, y_acc # Initialize with semantic or default
-                    if accessory in ["occhiali", "cinture", "scarpe", "auto"]: # For these, semantic x,y is primary guide
-                         current_x_loop, current_y_loop = semantic_x_acc, semantic_y_acc
-                    elif accessory in ["bracciali", "orologi"]:
-                        if current_zone_acc["target_side"] == "left": current_x_loop = current_zone_acc["x_end"] - item_img.width - (object_spacing //2)
-                        elif current_zone_acc["target_side"] == "right": current_x_loop = current_zone_acc["x_start"] + (object_spacing //2)
-                        else: current_x_loop = current_zone_acc["x_start"] + (current_zone_acc["x_end"] - current_zone_acc["x_start"] - item_img.width) // 2
-                        current_y_loop = shirt_y + shirt_img.height // 3 # Example y
-                    else: # wallet, profumi
-                        current_x_loop = random.randint(current_zone_acc["x_start"], max(current_zone_acc["x_start"], current_zone_acc["x_end"] - item_img.width))
-                        current_y_loop = random.randint(current_zone_acc["y_start"], max(current_zone_acc["y_start"], current_zone_acc["y_end"] - item_img.height))
-
-                    for attempt_in_zone_acc in range(max_attempts_per_zone_acc):
-                        if attempts_acc >= max_total_attempts_acc: break
-                        shift_x_acc = random.randint(-15, 15)
-                        shift_y_acc = random.randint(-15, 15)
-                        final_x_acc = current_x_loop + shift_x_acc
-                        final_y_acc = current_y_loop + shift_y_acc
-                        final_x_acc = max(current_zone_acc["x_start"], min(final_x_acc, current_zone_acc["x_end"] - item_img.width))
-                        final_y_acc = max(current_zone_acc["y_start"], min(final_y_acc, current_zone_acc["y_end"] - item_img.height))
-                        if not self.is_position_safe(final_x_acc, final_y_acc, item_img.width, item_img.height):
-                            attempts_acc += 1; continue
-                        overlaps_acc = False
-                        for occ_x, occ_y, occ_w, occ_h in occupied_areas:
-                            if (final_x_acc < occ_x + occ_w + object_spacing and final_x_acc + item_img.width > occ_x - object_spacing and final_y_acc < occ_y + occ_h + object_spacing and final_y_acc + item_img.height > occ_y - object_spacing):
-                                overlaps_acc = True; break
-                        if not overlaps_acc:
-                            x_acc, y_acc = final_x_acc, final_y_acc; placed_acc = True; break
-                        attempts_acc += 1
-                    if placed_acc: break
-                if not placed_acc: continue
-
-                canvas.paste(item_img, (x_acc, y_acc), item_img)
-                occupied_areas.append((x_acc, y_acc, item_img.width, item_img.height))
-                # Contrast check for accessory
-                acc_box_on_canvas = (x_acc, y_acc, x_acc + item_img.width, y_acc + item_img.height)
-                avg_acc_color = self.get_average_color(item_img) # Pass the item's own image
-                avg_bg_color_acc = self.get_average_color(canvas, box=acc_box_on_canvas)
-                lum_acc = self.get_relative_luminance(avg_acc_color)
-                lum_bg_acc = self.get_relative_luminance(avg_bg_color_acc)
-                contrast_acc = self.get_contrast_ratio(lum_acc, lum_bg_acc)
-                if contrast_acc < self.MIN_CONTRAST_THRESHOLD:
-                    print(f"Warning: Low contrast ({contrast_acc:.2f}) for ACCESSORY '{item_name}'. Item color: {avg_acc_color}, Bg: {avg_bg_color_acc}")
-
-                if show_names.get():
-                    text_width_acc = draw.textlength(item_name, font=font) if font else 0
-                    text_x_acc = x_acc + (item_img.width - text_width_acc) // 2
-                    text_y_acc = y_acc + item_img.height + 5
-                    text_x_acc = max(self.ACCESSORY_MARGIN, min(text_x_acc, self.TARGET_WIDTH - self.ACCESSORY_MARGIN - text_width_acc))
-                    text_y_acc = max(self.ACCESSORY_MARGIN, min(text_y_acc, self.TARGET_HEIGHT - self.ACCESSORY_MARGIN - font_size))
-                    draw.text((text_x_acc, text_y_acc), item_name, font=font, fill=font_color_rgb)
-                    if text_width_acc > 0:
-                        occupied_areas.append((text_x_acc, text_y_acc, text_width_acc, font_size))
-                        # Contrast check for accessory text
-                        text_bbox_acc = (text_x_acc, text_y_acc, text_x_acc + text_width_acc, text_y_acc + font_size)
-                        avg_text_bg_color_acc = self.get_average_color(canvas, box=text_bbox_acc)
-                        lum_text_acc = self.get_relative_luminance(font_color_rgb)
-                        lum_text_bg_acc = self.get_relative_luminance(avg_text_bg_color_acc)
-                        text_contrast_acc = self.get_contrast_ratio(lum_text_acc, lum_text_bg_acc)
-                        if text_contrast_acc < self.MIN_TEXT_CONTRAST_THRESHOLD:
-                             print(f"Warning: Low contrast ({text_contrast_acc:.2f}) for ACCESSORY TEXT '{item_name}'. Text: {font_color_rgb}, Bg: {avg_text_bg_color_acc}")
-
-            # Watermark (copied and adapted)
-            if use_watermark.get() and watermark_path_var.get():
-                watermark_original = self.fix_image_orientation(Image.open(watermark_path_var.get()).convert("RGBA"))
-                max_wm_width = int(self.TARGET_WIDTH * 0.25)
-                watermark = watermark_original
-                if watermark.width > max_wm_width:
-                    aspect_ratio = watermark.height / watermark.width
-                    new_wm_width = max_wm_width
-                    new_wm_height = int(new_wm_width * aspect_ratio)
-                    if new_wm_height > 0: watermark = watermark.resize((new_wm_width, new_wm_height), Image.Resampling.LANCZOS)
-                    else: watermark = None; print(f"Warning: Watermark ({watermark_path_var.get()}) resized to zero height. Skipping.")
-                if watermark:
-                    padding_top = self.WATERMARK_MARGIN_TOP
-                    padding_bottom = self.WATERMARK_MARGIN_BOTTOM_TIKTOK
-                    wm_y_pos = padding_top if watermark_position.get() == "Sopra" else self.TARGET_HEIGHT - watermark.height - padding_bottom
-                    wm_x_pos = (self.TARGET_WIDTH - watermark.width) // 2
-                    watermark_rect = (wm_x_pos, wm_y_pos, watermark.width, watermark.height)
-                    watermark_overlaps = False
-                    for occ_x, occ_y, occ_w, occ_h in occupied_areas:
-                        if (watermark_rect[0] < occ_x + occ_w and watermark_rect[0] + watermark_rect[2] > occ_x and watermark_rect[1] < occ_y + occ_h and watermark_rect[1] + watermark_rect[3] > occ_y):
-                            watermark_overlaps = True; break
-                    if not watermark_overlaps: canvas.paste(watermark, (wm_x_pos, wm_y_pos), watermark)
-                    else: print(f"Warning: Watermark placement at ({wm_x_pos}, {wm_y_pos}) would overlap. Skipping watermark.")
-
-            return canvas
-
+            settings = self.settings_from_widgets(
+                width_entry, height_entry, show_names, use_watermark, watermark_path_var, watermark_position, selected_font,
+                blur_slider_val, brightness_slider_val, spacing_slider_val, size_main_slider_val, size_accessory_slider_val,
+                accessory_count_val, object_spacing_val, font_color_rgb)
+            settings.check_contrast = True # L'anteprima stampa gli avvisi di basso contrasto
+            settings.draft_factor = self.PREVIEW_DRAFT_FACTOR
+            # Seed e risoluzione stampati permettono di rigenerare l'anteprima con render_seed (layout_size)
+            seed = self.new_seed()
+            print(f"DEBUG: Seed anteprima: {seed} (layout {settings.width}x{settings.height})")
+            return self.render_seed(settings, seed)
+        except OutfitGenerationError as e:
+            messagebox.showerror("Errore", str(e))
+            return None
         except Exception as e:
             traceback.print_exc()
             messagebox.showerror("Errore", f"Si è verificato un errore durante la generazione dell'anteprima: {str(e)}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,255 @@
+import json
+from dataclasses import dataclass, field
+
+try:
+    import msgpack # Opzionale: serve solo per Scene.to_msgpack / from_msgpack
+except ImportError:
+    msgpack = None
+
+
+@dataclass
+class RenderSettings:
+    """Parametri di un render come valori semplici, senza widget Tk.
+
+    I campi usano le stesse unita' degli slider della GUI (percentuali per le grandezze,
+    valori grezzi per distanze, sfocatura e luminosita').
+    """
+    width: int = 1080
+    height: int = 1920
+    blur: float = 2
+    brightness: float = -30
+    garment_spacing: int = 20  # Distanza maglia-pantaloni (0-100)
+    size_main: int = 120  # Grandezza maglie/pantaloni (50-200%)
+    size_accessory: int = 80  # Grandezza accessori (50-200%)
+    accessory_count: int = 3
+    object_spacing: int = 30  # Distanza tra oggetti (0-100)
+    show_names: bool = False
+    font_name: str = "Random"
+    font_color: tuple = (255, 255, 255)
+    use_watermark: bool = False
+    watermark_path: str = ""
+    watermark_position: str = "Sopra"  # "Sopra" o "Sotto"
+    output_format: str = "PNG"
+    check_contrast: bool = False  # Stampa avvisi di basso contrasto (usato dall'anteprima)
+    export_sizes: tuple = ()  # Altri formati (w, h) renderizzati dallo stesso layout, es. ((1080, 1350), (1080, 1080))
+    draft_factor: int = 1  # 1 = render finale, 2 o 4 = bozza a 1/2 o 1/4 con lo stesso layout
+
+
+# Versione del formato compatto prodotto da Scene.to_record (JSON / msgpack)
+SCENE_FORMAT_VERSION = 1
+
+
+@dataclass(slots=True)
+class AccessoryRule:
+    """Regola di una categoria di accessori, da accessory_rules.json.
+
+    anchor: punto preferito ("above_shirt", "waist", "below_pants", "largest_zone", "garment_edge"
+    oppure "free" per una posizione libera casuale). size: frazioni (larghezza, altezza) dell'area
+    utile. priority: ordine di scelta, i numeri bassi prima. fallback: strategie provate in ordine
+    ("zones", "content_area", "alpha_mask").
+    """
+    category: str
+    anchor: str = "free"
+    size: tuple = (0.15, 0.15)
+    priority: int = 10
+    fallback: tuple = ("zones", "content_area", "alpha_mask")
+
+
+@dataclass(slots=True)
+class Box:
+    """Rettangolo (x, y, w, h) in pixel del canvas."""
+    x: float
+    y: float
+    w: float
+    h: float
+
+    @property
+    def right(self):
+        return self.x + self.w
+
+    @property
+    def bottom(self):
+        return self.y + self.h
+
+    def overlaps(self, other, margin=0):
+        # Intersezione con `other` allargato di `margin` su ogni lato
+        return (self.x < other.x + other.w + margin and self.x + self.w > other.x - margin and
+                self.y < other.y + other.h + margin and self.y + self.h > other.y - margin)
+
+    def to_record(self):
+        return [self.x, self.y, self.w, self.h]
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(*record)
+
+
+@dataclass(slots=True)
+class Zone:
+    """Area in cui si cercano posizioni per gli accessori."""
+    id: str
+    x_start: int
+    x_end: int
+    y_start: int
+    y_end: int
+    target_side: str = "none"  # "left", "right" o "none": lato dei capi principali
+
+    @property
+    def width(self):
+        return self.x_end - self.x_start
+
+    @property
+    def height(self):
+        return self.y_end - self.y_start
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+
+@dataclass(slots=True)
+class Background:
+    kind: str  # "solid" o "photo"
+    color: tuple = None
+    path: str = None
+    blur: float = 0
+    brightness: float = 0
+
+    def to_record(self):
+        return [self.kind, list(self.color) if self.color else None, self.path, self.blur, self.brightness]
+
+    @classmethod
+    def from_record(cls, record):
+        kind, color, path, blur, brightness = record
+        return cls(kind, tuple(color) if color else None, path, blur, brightness)
+
+
+@dataclass(slots=True)
+class Layer:
+    """Un asset posizionato: `path` e' il file originale (chiave del catalogo)."""
+    role: str  # "shirt", "pants" o "accessory"
+    category: str
+    path: str
+    name: str
+    max_w: int
+    max_h: int
+    box: Box
+
+    def to_record(self):
+        return [self.role, self.category, self.path, self.name, self.max_w, self.max_h] + self.box.to_record()
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(*record[:6], Box.from_record(record[6:10]))
+
+
+@dataclass(slots=True)
+class Label:
+    layer: int  # Indice del livello a cui appartiene il nome
+    text: str
+    box: Box  # Posizione del testo; l'altezza e' la dimensione del font
+
+    def to_record(self):
+        return [self.layer, self.text] + self.box.to_record()
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record[0], record[1], Box.from_record(record[2:6]))
+
+
+@dataclass(slots=True)
+class Watermark:
+    path: str
+    max_w: int
+    max_h: int
+    box: Box
+
+    def to_record(self):
+        return [self.path, self.max_w, self.max_h] + self.box.to_record()
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(*record[:3], Box.from_record(record[3:7]))
+
+
+@dataclass(slots=True)
+class Scene:
+    """Descrizione completa di un outfit, senza pixel: prodotta da solve_layout, rasterizzata da composite_scene."""
+    width: int
+    height: int
+    background: Background = None
+    layers: list = field(default_factory=list)
+    labels: list = field(default_factory=list)
+    watermark: Watermark = None
+    font: str = None
+    font_size: int = 30
+    font_color: tuple = (255, 255, 255)
+
+    def to_record(self):
+        # Liste annidate senza nomi di campo: compatte sia in JSON che in msgpack
+        return [SCENE_FORMAT_VERSION, self.width, self.height, self.background.to_record(),
+                [layer.to_record() for layer in self.layers], [label.to_record() for label in self.labels],
+                self.watermark.to_record() if self.watermark else None,
+                self.font, self.font_size, list(self.font_color)]
+
+    @classmethod
+    def from_record(cls, record):
+        if record[0] != SCENE_FORMAT_VERSION:
+            raise ValueError(f"Versione della scena non supportata: {record[0]}")
+        _, width, height, background, layers, labels, watermark, font, font_size, font_color = record
+        return cls(width, height, Background.from_record(background),
+                   [Layer.from_record(layer) for layer in layers], [Label.from_record(label) for label in labels],
+                   Watermark.from_record(watermark) if watermark else None,
+                   font, font_size, tuple(font_color))
+
+    def to_json(self):
+        return json.dumps(self.to_record(), separators=(",", ":"), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls.from_record(json.loads(data))
+
+    def to_msgpack(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack non e' installato: usa to_json oppure 'pip install msgpack'.")
+        return msgpack.packb(self.to_record(), use_bin_type=True)
+
+    @classmethod
+    def from_msgpack(cls, data):
+        if msgpack is None:
+            raise RuntimeError("msgpack non e' installato: usa from_json oppure 'pip install msgpack'.")
+        return cls.from_record(msgpack.unpackb(data, raw=False))
+
+
+@dataclass(slots=True)
+class Frame:
+    """Geometria di un canvas di qualsiasi risoluzione.
+
+    Margini, distanze e dimensione del font sono definiti sul formato di riferimento
+    (1080x1920) e vengono scalati con `px`; le grandezze dei capi sono gia' relative all'area utile.
+    """
+    width: int
+    height: int
+    reference_width: int = 1080
+    reference_height: int = 1920
+    reference_margin: int = 100
+
+    @property
+    def scale(self):
+        # Il lato piu' "stretto" rispetto al riferimento decide la scala: il layout ci sta sempre
+        return min(self.width / self.reference_width, self.height / self.reference_height)
+
+    def px(self, value):
+        return int(round(value * self.scale))
+
+    @property
+    def margin(self):
+        return self.px(self.reference_margin)
+
+    @property
+    def content_width(self):
+        return self.width - 2 * self.margin
+
+    @property
+    def content_height(self):
+        return self.height - 2 * self.margin
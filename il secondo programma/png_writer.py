@@ -0,0 +1,67 @@
+import os
+import zlib
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COLOR_TYPES = {"RGB": 2, "RGBA": 6}
+
+
+class StreamingPNGWriter:
+    """Scrive un PNG a strisce orizzontali, senza tenere in memoria l'immagine intera.
+
+    Le righe arrivano in ordine con write_strip(Image); ogni striscia viene compressa e scritta
+    subito in un chunk IDAT. Il file compare al suo percorso solo a close() (scrittura atomica).
+    """
+
+    def __init__(self, path, width, height, mode="RGBA", compress_level=6, text=None):
+        if mode not in PNG_COLOR_TYPES:
+            raise ValueError(f"Modo {mode} non supportato dal writer PNG")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.rows_written = 0
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._compressor = zlib.compressobj(compress_level)
+        self._file.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[mode], 0, 0, 0))
+        for key, value in (text or {}).items():
+            # tEXt: chiave e valore Latin-1 separati da un byte nullo
+            self._write_chunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1", "replace"))
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    def write_strip(self, strip):
+        if strip.mode != self.mode:
+            strip = strip.convert(self.mode)
+        if strip.width != self.width or self.rows_written + strip.height > self.height:
+            raise ValueError("La striscia non corrisponde alle dimensioni del PNG")
+        raw = strip.tobytes()
+        stride = self.width * len(self.mode)
+        # Ogni riga PNG inizia con il byte del filtro (0 = nessun filtro)
+        rows = b"".join(b"\0" + raw[offset:offset + stride] for offset in range(0, len(raw), stride))
+        data = self._compressor.compress(rows)
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += strip.height
+
+    def close(self):
+        if self.rows_written != self.height:
+            self.abort()
+            raise ValueError(f"PNG incompleto: {self.rows_written}/{self.height} righe")
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -0,0 +1,134 @@
+import math
+from collision_mask import CoverageMask
+
+
+class OccupancyGrid:
+    """Indice a griglia uniforme delle aree occupate (Box di capi, accessori e nomi) di un frame.
+
+    Ogni Box viene registrato nelle celle che copre: un controllo di sovrapposizione guarda solo
+    i Box delle celle toccate dal rettangolo cercato (allargato del margine), non tutta la lista.
+    Si puo' iterare come la vecchia lista occupied_areas.
+    Accanto ai box tiene, se richiesta, la CoverageMask a celle di `mask_cell` pixel costruita
+    dalle maschere alpha degli oggetti: viene creata solo al primo uso (coverage()).
+    """
+
+    def __init__(self, width, height, cell_size=128, mask_cell=8):
+        self.width = width
+        self.height = height
+        self.cell_size = max(1, int(cell_size))
+        self.columns = max(1, math.ceil(width / self.cell_size))
+        self.rows = max(1, math.ceil(height / self.cell_size))
+        self.mask_cell = mask_cell
+        self._boxes = []
+        self._masks = [] # Per ogni box: funzione che restituisce la maschera alpha, None per un rettangolo pieno
+        self._cells = {} # (colonna, riga) -> indici in _boxes
+        self._coverage = None
+
+    def __iter__(self):
+        return iter(self._boxes)
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cell_range(self, x, y, right, bottom):
+        # Celle coperte da [x, right) x [y, bottom), limitate alla griglia (i Box fuori frame finiscono sul bordo)
+        size = self.cell_size
+        first_column = min(self.columns - 1, max(0, int(x // size)))
+        last_column = min(self.columns - 1, max(0, int(math.ceil(right / size)) - 1))
+        first_row = min(self.rows - 1, max(0, int(y // size)))
+        last_row = min(self.rows - 1, max(0, int(math.ceil(bottom / size)) - 1))
+        return range(first_column, last_column + 1), range(first_row, last_row + 1)
+
+    def insert(self, box, mask=None):
+        # mask: funzione senza argomenti -> righe della maschera alpha a celle di mask_cell (collision_mask)
+        index = len(self._boxes)
+        self._boxes.append(box)
+        self._masks.append(mask)
+        columns, rows = self._cell_range(box.x, box.y, box.right, box.bottom)
+        for row in rows:
+            for column in columns:
+                self._cells.setdefault((column, row), []).append(index)
+        if self._coverage is not None:
+            self._add_coverage(box, mask)
+
+    def coverage(self):
+        if self._coverage is None:
+            self._coverage = CoverageMask(self.width, self.height, self.mask_cell)
+            for box, mask in zip(self._boxes, self._masks):
+                self._add_coverage(box, mask)
+        return self._coverage
+
+    def _add_coverage(self, box, mask):
+        if mask is None:
+            self._coverage.add_box(box)
+        else:
+            self._coverage.add(box.x, box.y, mask())
+
+    def overlaps(self, box, margin=0):
+        columns, rows = self._cell_range(box.x - margin, box.y - margin, box.right + margin, box.bottom + margin)
+        for row in rows:
+            for column in columns:
+                for index in self._cells.get((column, row), ()):
+                    if box.overlaps(self._boxes[index], margin):
+                        return True
+        return False
+
+    def boxes_since(self, start):
+        # Box inseriti dopo i primi `start`: per aggiornare strutture derivate (FreeRectangles)
+        return self._boxes[start:]
+
+
+class FreeRectangles:
+    """Spazio libero di una zona come insieme di rettangoli massimali (algoritmo MaxRects).
+
+    Ogni area occupata, allargata di `spacing`, viene sottratta dividendo i rettangoli che tocca in
+    al massimo quattro parti; i rettangoli contenuti in altri vengono scartati. Un oggetto w x h
+    entra nella zona solo se entra in uno dei rettangoli, e in quel caso ogni posizione del
+    rettangolo che lo contiene e' valida.
+    """
+
+    def __init__(self, x_start, y_start, x_end, y_end, spacing=0):
+        self.spacing = spacing
+        self.rects = [(x_start, y_start, x_end, y_end)] if x_end > x_start and y_end > y_start else []
+        self._synced = 0 # Box dell'OccupancyGrid gia' sottratti
+
+    def subtract(self, box):
+        left, top = box.x - self.spacing, box.y - self.spacing
+        right, bottom = box.right + self.spacing, box.bottom + self.spacing
+        split = []
+        for rect in self.rects:
+            rect_left, rect_top, rect_right, rect_bottom = rect
+            if left >= rect_right or right <= rect_left or top >= rect_bottom or bottom <= rect_top:
+                split.append(rect)
+                continue
+            if left > rect_left:
+                split.append((rect_left, rect_top, left, rect_bottom))
+            if right < rect_right:
+                split.append((right, rect_top, rect_right, rect_bottom))
+            if top > rect_top:
+                split.append((rect_left, rect_top, rect_right, top))
+            if bottom < rect_bottom:
+                split.append((rect_left, bottom, rect_right, rect_bottom))
+        # Restano solo i rettangoli massimali (i duplicati contano una volta)
+        split = list(dict.fromkeys(split))
+        self.rects = [rect for rect in split if not any(
+            other is not rect and other[0] <= rect[0] and other[1] <= rect[1] and other[2] >= rect[2] and other[3] >= rect[3]
+            for other in split)]
+
+    def sync(self, occupied_areas):
+        # Sottrae i Box aggiunti all'OccupancyGrid dall'ultima chiamata
+        for box in occupied_areas.boxes_since(self._synced):
+            self.subtract(box)
+        self._synced = len(occupied_areas)
+
+    def slots(self, w, h):
+        """Intervalli interi (min_x, min_y, max_x, max_y) dell'angolo in alto a sinistra di un oggetto
+        w x h: qualunque punto di un intervallo e' libero. Lista vuota se l'oggetto non entra.
+        """
+        slots = []
+        for rect_left, rect_top, rect_right, rect_bottom in self.rects:
+            min_x, max_x = math.ceil(rect_left), math.floor(rect_right - w)
+            min_y, max_y = math.ceil(rect_top), math.floor(rect_bottom - h)
+            if min_x <= max_x and min_y <= max_y:
+                slots.append((min_x, min_y, max_x, max_y))
+        return slots
@@ -0,0 +1,47 @@
+import os
+import mmap
+import struct
+import tempfile
+from PIL import Image
+
+# Formato: header fisso + pixel RGBA grezzi riga per riga, senza compressione
+RAW_SPRITE_MAGIC = b"OGRS"
+RAW_SPRITE_VERSION = 1
+RAW_SPRITE_HEADER = struct.Struct("<4sHHII")  # magic, versione, riservato, larghezza, altezza
+RAW_SPRITE_EXTENSION = ".rgba"
+
+
+def write_raw_sprite(img, path):
+    """Salva uno sprite come RGBA grezzo con header, in modo atomico (file temporaneo unico per scrittore)."""
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(RAW_SPRITE_HEADER.pack(RAW_SPRITE_MAGIC, RAW_SPRITE_VERSION, 0, img.width, img.height))
+            f.write(img.tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def open_raw_sprite(path):
+    """Mappa in memoria uno sprite grezzo e lo avvolge in un'Image senza copiare ne' decodificare.
+
+    Piu' processi che aprono lo stesso file condividono la stessa copia nella page cache.
+    L'immagine e' in sola lettura: le operazioni di Pillow che la modificano ne creano una copia.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, width, height = RAW_SPRITE_HEADER.unpack_from(mapped, 0)
+    if magic != RAW_SPRITE_MAGIC or version != RAW_SPRITE_VERSION:
+        mapped.close()
+        raise ValueError(f"{path} non e' uno sprite grezzo valido")
+    if len(mapped) < RAW_SPRITE_HEADER.size + width * height * 4:
+        mapped.close()
+        raise ValueError(f"{path} e' troncato")
+    pixels = memoryview(mapped)[RAW_SPRITE_HEADER.size:RAW_SPRITE_HEADER.size + width * height * 4]
+    return Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)